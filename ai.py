@@ -0,0 +1,665 @@
+# OpenAI 调用：客户端创建、提示词增强（单条同步 / 批量异步并发）
+# openai / httpx 导入较慢，且多数会话不使用AI功能，因此在首次调用时才导入
+
+import asyncio
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import time
+
+import metrics
+from response_cache import ResponseCache
+
+MODEL = "gpt-4"
+TEMPERATURE = 0.7
+
+# AI快速生成：一句话需求 -> 完整提示词
+QUICK_SYSTEM_PROMPT = """你是专业的Sora2视频提示词专家。
+
+用户会用一句话描述他们的需求，你需要将其转换为完整、详细、专业的Sora2视频生成提示词。
+
+提示词要求：
+1. 包含时长、场景、主体、动作等基础信息
+2. 详细描述镜头语言（镜头类型、运镜方式、景深等）
+3. 描述视觉风格和色调氛围
+4. 如果适用，添加光影效果、粒子效果、音频建议等
+5. 语言要具体、生动、适合AI理解
+6. 长度适中（200-400字）
+
+直接输出提示词，不要解释或其他内容。"""
+QUICK_USER_TEMPLATE = "需求：{requirement}"
+
+# AI优化：润色已生成的提示词
+OPTIMIZE_SYSTEM_PROMPT = "你是Sora2提示词专家。优化用户提供的提示词，使其更生动、更具体、更适合AI视频生成。"
+OPTIMIZE_USER_TEMPLATE = "请优化以下提示词：\n\n{prompt}"
+
+# 提示词增强（单个生成的 AI增强 与 批量增强共用）
+ENHANCE_SYSTEM_PROMPT = "你是一个专业的Sora2视频提示词专家。请优化和丰富用户提供的提示词，使其更加生动、具体、适合AI视频生成。保持原有风格和核心内容，增加细节描述。"
+ENHANCE_USER_TEMPLATE = "请优化以下Sora2提示词：\n\n{prompt}"
+
+# 增强结果大致长度，用于 TPM 限流预估
+ENHANCE_COMPLETION_TOKENS = 600
+
+# 打包增强：一次请求优化多条提示词，系统提示词只发送一次，结果以 JSON 返回
+PACKED_ENHANCE_SYSTEM_PROMPT = ENHANCE_SYSTEM_PROMPT + """
+
+用户会一次提供多条提示词，格式为 JSON 数组 [{"id": 编号, "prompt": 提示词}]。
+请逐条独立优化，只输出一个 JSON 对象：{"results": [{"id": 编号, "prompt": 优化后的提示词}]}。
+每条都必须输出且编号不变，不要输出任何其他内容。"""
+PACKED_ENHANCE_USER_TEMPLATE = "请逐条优化以下Sora2提示词：\n\n{items}"
+
+# 模型上下文长度（token），打包时输入与预估输出之和不超过该值
+CONTEXT_TOKENS = int(os.environ.get("SORA2_CONTEXT_TOKENS", "8192"))
+# 每个包的最大条数
+MAX_PACK_SIZE = 20
+
+# 指标中的调用点标签：按系统提示词区分 AI快速生成 / AI优化 / 提示词增强
+CALL_SITES = {
+    QUICK_SYSTEM_PROMPT: "quick",
+    OPTIMIZE_SYSTEM_PROMPT: "optimize",
+    ENHANCE_SYSTEM_PROMPT: "enhance",
+    PACKED_ENHANCE_SYSTEM_PROMPT: "enhance_packed",
+}
+
+
+def _call_site(system_prompt):
+    return CALL_SITES.get(system_prompt, "other")
+
+
+def _record_error(call, error):
+    metrics.inc("sora2_openai_errors_total", call=call, error=type(error).__name__)
+
+
+def _record_usage(call, usage):
+    """记录接口返回的 token 用量"""
+    if usage is None:
+        return
+    metrics.inc("sora2_openai_tokens_total", usage.prompt_tokens, call=call, type="prompt")
+    metrics.inc("sora2_openai_tokens_total", usage.completion_tokens, call=call, type="completion")
+
+
+def _retryable_errors():
+    """可重试的错误：限流、连接/超时、服务端错误"""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+
+def _is_fatal(error):
+    """重试或拆成单条请求也不会成功的错误：认证、权限、请求无效、额度用尽"""
+    import openai
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError, openai.BadRequestError)):
+        return True
+    return isinstance(error, openai.RateLimitError) and getattr(error, "code", None) == "insufficient_quota"
+
+
+# 连接池配置（环境变量）；HTTP/2 需要额外安装 h2
+HTTP2 = os.environ.get("SORA2_HTTP2", "0") == "1" and importlib.util.find_spec("h2") is not None
+POOL_MAX_CONNECTIONS = int(os.environ.get("SORA2_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.environ.get("SORA2_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("SORA2_POOL_KEEPALIVE_EXPIRY", "60"))
+# 客户端闲置超过该秒数后从注册表移除
+CLIENT_IDLE_TTL = float(os.environ.get("SORA2_CLIENT_IDLE_TTL", "1800"))
+
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+    )
+
+
+# 进程内共享的 httpx 连接池，所有会话、所有 API Key 复用同一组 keep-alive 连接
+_http_client = None
+# sha256(API Key) -> [OpenAI 客户端, 最近使用时间]
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_http_client():
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.Client(limits=_pool_limits(), http2=HTTP2, timeout=30.0)
+    return _http_client
+
+
+# Helper function to initialize OpenAI client safely
+def create_openai_client(api_key, http_client=None):
+    """
+    Create OpenAI client with proper configuration.
+    Handles proxy settings properly for OpenAI v1.0+
+    """
+    # Remove any proxy-related environment variables that might interfere
+    # OpenAI v1.0+ uses httpx which respects HTTP_PROXY/HTTPS_PROXY env vars
+    # but doesn't accept 'proxies' as a constructor parameter
+    from openai import OpenAI
+
+    try:
+        client = OpenAI(
+            api_key=api_key,
+            max_retries=2,
+            timeout=30.0,
+            http_client=http_client
+        )
+        return client
+    except TypeError as e:
+        if "proxies" in str(e):
+            # If proxies parameter is being passed incorrectly, try with minimal config
+            client = OpenAI(api_key=api_key)
+            return client
+        else:
+            raise
+
+
+def get_openai_client(api_key):
+    """按 API Key 复用 OpenAI 客户端（跨会话共享连接池），并清理闲置客户端"""
+    key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    with _clients_lock:
+        for stale_key in [k for k, (_, last_used) in _clients.items() if now - last_used > CLIENT_IDLE_TTL]:
+            del _clients[stale_key]
+        entry = _clients.get(key)
+        if entry is None:
+            entry = _clients[key] = [create_openai_client(api_key, http_client=_shared_http_client()), now]
+        entry[1] = now
+        return entry[0]
+
+
+# 响应缓存配置（环境变量）
+CACHE_PATH = os.environ.get("SORA2_CACHE_PATH", os.path.join(".cache", "sora2_responses.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.environ.get("SORA2_CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = float(os.environ["SORA2_CACHE_TTL"]) if os.environ.get("SORA2_CACHE_TTL") else None
+
+_response_cache = None
+
+
+def get_response_cache():
+    """进程内共享的响应缓存，首次使用时创建"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+    return _response_cache
+
+
+# 单飞（single-flight）：进程内正在进行的请求，键为完整请求内容的哈希加上 API Key 的哈希和服务地址
+# 相同请求并发到达时（多个会话同一需求、连续点击按钮）只有第一个真正请求上游，其余等待并共享结果；
+# 不同 Key 或不同服务的请求互不共享（无效 Key 的请求不能借用其他 Key 的结果，配额也各自计算）
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _inflight_key(cache_key, api_key, base_url=None):
+    """单飞键：缓存键 + API Key 哈希 + 服务地址"""
+    key_hash = hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()
+    return f"{cache_key}:{key_hash}:{base_url or ''}"
+
+
+def _claim_inflight(key):
+    """加入进行中的请求表
+
+    Returns:
+        (Future, 是否为发起者)；发起者完成后必须调用 _release_inflight
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future, False
+        future = _inflight[key] = concurrent.futures.Future()
+        # 标记为执行中，等待者取消等待时不会连带取消这个 Future
+        future.set_running_or_notify_cancel()
+        return future, True
+
+
+def _release_inflight(key, future, text=None):
+    """发起者结束：移出请求表并唤醒等待者；text 为 None 表示失败或中途放弃
+
+    只共享成功的结果；发起者失败时等待者各自重新发起（错误可能只属于发起者，如被取消、超时）。
+    """
+    with _inflight_lock:
+        _inflight.pop(key, None)
+    future.set_result(text)
+
+
+def _wait_inflight(future, call):
+    """等待发起者的结果；发起者失败或放弃时返回 None"""
+    metrics.inc("sora2_openai_coalesced_total", call=call)
+    return future.result()
+
+
+async def _wait_inflight_async(future, call):
+    """_wait_inflight 的异步版本，发起者可以在其他线程或事件循环中"""
+    metrics.inc("sora2_openai_coalesced_total", call=call)
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+
+def chat_completion(api_key, system_prompt, user_content, use_cache=True):
+    """调用一次 chat.completions 并返回文本
+
+    Args:
+        use_cache: False 时跳过缓存读取直接请求（结果仍会写回缓存），用于“重新生成”
+    """
+    call = _call_site(system_prompt)
+    cache = get_response_cache()
+    key = ResponseCache.make_key(MODEL, system_prompt, user_content, TEMPERATURE)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.inc("sora2_openai_cache_hits_total", call=call)
+            return cached
+
+    flight_key = _inflight_key(key, api_key)
+    while True:
+        future, leader = _claim_inflight(flight_key)
+        if leader:
+            break
+        text = _wait_inflight(future, call)
+        if text is not None:
+            return text
+
+    try:
+        client = get_openai_client(api_key)
+        metrics.inc("sora2_openai_requests_total", call=call)
+        try:
+            with metrics.timer("sora2_openai_seconds", call=call):
+                response = client.chat.completions.create(
+                    model=MODEL,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_content}
+                    ],
+                    temperature=TEMPERATURE
+                )
+        except Exception as e:
+            _record_error(call, e)
+            raise
+        _record_usage(call, response.usage)
+        text = response.choices[0].message.content
+        cache.set(key, text)
+    except BaseException:
+        _release_inflight(flight_key, future)
+        raise
+    _release_inflight(flight_key, future, text)
+    return text
+
+
+def stream_chat_completion(api_key, system_prompt, user_content, use_cache=True):
+    """流式调用 chat.completions，逐段产出文本；完整结果写回缓存
+
+    缓存命中时一次性产出完整文本。
+    """
+    call = _call_site(system_prompt)
+    cache = get_response_cache()
+    key = ResponseCache.make_key(MODEL, system_prompt, user_content, TEMPERATURE)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.inc("sora2_openai_cache_hits_total", call=call)
+            yield cached
+            return
+
+    # 相同请求正在进行时等待其完整结果，一次性产出
+    flight_key = _inflight_key(key, api_key)
+    while True:
+        future, leader = _claim_inflight(flight_key)
+        if leader:
+            break
+        text = _wait_inflight(future, call)
+        if text is not None:
+            yield text
+            return
+
+    try:
+        client = get_openai_client(api_key)
+        metrics.inc("sora2_openai_requests_total", call=call)
+        parts = []
+        try:
+            with metrics.timer("sora2_openai_seconds", call=call):
+                stream = client.chat.completions.create(
+                    model=MODEL,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_content}
+                    ],
+                    temperature=TEMPERATURE,
+                    stream=True
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        except Exception as e:
+            _record_error(call, e)
+            raise
+        text = "".join(parts)
+        # 流式响应不含 usage，按本地估算记录
+        metrics.inc("sora2_openai_tokens_total", estimate_tokens(system_prompt + user_content), call=call, type="prompt")
+        metrics.inc("sora2_openai_tokens_total", estimate_tokens(text), call=call, type="completion")
+        cache.set(key, text)
+    except BaseException:
+        # 包括页面重跑时生成器被关闭（GeneratorExit），等待者会改为自行请求
+        _release_inflight(flight_key, future)
+        raise
+    _release_inflight(flight_key, future, text)
+
+
+def estimate_tokens(text):
+    """本地粗略估算 token 数：中日韩字符约1个token，其余约4个字符1个token"""
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class _Bucket:
+    """每分钟额度的令牌桶"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount):
+        """额度足够时扣除并返回0，否则返回还需等待的秒数"""
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            self.available -= amount
+            return 0.0
+        return (amount - self.available) / self.rate
+
+
+class RateLimiter:
+    """按每分钟请求数(RPM)和token数(TPM)限流，None 表示不限制"""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        # 持锁等待，保证请求按到达顺序放行
+        async with self._lock:
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is None:
+                    continue
+                delay = bucket.wait_time(amount)
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = bucket.wait_time(amount)
+
+
+def _retry_delay(attempt):
+    """第 attempt 次（0 起）失败后的退避秒数：指数增长，最多30秒"""
+    return min(2 ** attempt, 30)
+
+
+async def _create_with_retries(client, limiter, semaphore, system_prompt, content, completion_tokens, max_retries):
+    """限流后发起一次 chat 请求，可重试的错误按指数退避重试，返回文本
+
+    每次请求占用 semaphore 的一个名额，退避等待期间不占用。
+    """
+    call = _call_site(system_prompt)
+    retryable_errors = _retryable_errors()
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
+                await limiter.acquire(estimate_tokens(system_prompt + content) + completion_tokens)
+                metrics.inc("sora2_openai_requests_total", call=call)
+                with metrics.timer("sora2_openai_seconds", call=call):
+                    response = await client.chat.completions.create(
+                        model=MODEL,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": content}
+                        ],
+                        temperature=TEMPERATURE
+                    )
+            _record_usage(call, response.usage)
+            return response.choices[0].message.content
+        except retryable_errors as e:
+            if attempt == max_retries or _is_fatal(e):
+                _record_error(call, e)
+                raise
+            metrics.inc("sora2_openai_retries_total", call=call)
+            await asyncio.sleep(_retry_delay(attempt))
+        except Exception as e:
+            _record_error(call, e)
+            raise
+
+
+def _enhance_key(prompt):
+    """单条增强结果的缓存键；打包请求解析出的结果也按它缓存，两种方式互相命中"""
+    return ResponseCache.make_key(MODEL, ENHANCE_SYSTEM_PROMPT, ENHANCE_USER_TEMPLATE.format(prompt=prompt), TEMPERATURE)
+
+
+async def _enhance_one(client, limiter, semaphore, prompt, max_retries, use_cache):
+    content = ENHANCE_USER_TEMPLATE.format(prompt=prompt)
+    cache = get_response_cache()
+    key = _enhance_key(prompt)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.inc("sora2_openai_cache_hits_total", call="enhance")
+            return cached
+
+    flight_key = _inflight_key(key, client.api_key, client.base_url)
+    while True:
+        future, leader = _claim_inflight(flight_key)
+        if leader:
+            break
+        text = await _wait_inflight_async(future, "enhance")
+        if text is not None:
+            return text
+
+    try:
+        text = await _create_with_retries(
+            client, limiter, semaphore, ENHANCE_SYSTEM_PROMPT, content, ENHANCE_COMPLETION_TOKENS, max_retries
+        )
+        cache.set(key, text)
+    except BaseException:
+        _release_inflight(flight_key, future)
+        raise
+    _release_inflight(flight_key, future, text)
+    return text
+
+
+def _completion_tokens(prompt):
+    """一条提示词增强结果的预估输出 token（增强结果通常比原文长）"""
+    return max(ENHANCE_COMPLETION_TOKENS, 2 * estimate_tokens(prompt))
+
+
+def _pack_cost(prompt):
+    """一条提示词在包中占用的上下文 token：输入 + JSON 包装 + 预估输出"""
+    return estimate_tokens(prompt) + 10 + _completion_tokens(prompt)
+
+
+def pack_prompts(items, pack_size, context_tokens=None):
+    """按原顺序把 (id, 提示词) 装入若干包
+
+    每包最多 pack_size 条，且系统提示词、输入和预估输出的 token 之和不超过上下文长度；
+    单条就超出预算的提示词单独成包（按单条请求发送）。
+
+    Returns:
+        包列表，每个包是 (id, 提示词) 列表
+    """
+    budget = (context_tokens or CONTEXT_TOKENS) - estimate_tokens(PACKED_ENHANCE_SYSTEM_PROMPT + PACKED_ENHANCE_USER_TEMPLATE)
+    packs = []
+    current, used = [], 0
+    for item_id, prompt in items:
+        cost = _pack_cost(prompt)
+        if current and (len(current) >= pack_size or used + cost > budget):
+            packs.append(current)
+            current, used = [], 0
+        current.append((item_id, prompt))
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def parse_packed_response(text, count):
+    """解析打包增强的响应
+
+    容忍 Markdown 代码块和 JSON 前后的说明文字；编号越界、重复、内容为空的条目丢弃。
+
+    Returns:
+        包内序号（0 起）-> 增强结果
+    """
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        try:
+            data = json.loads(text[text.find("{"):text.rfind("}") + 1])
+        except ValueError:
+            return {}
+    entries = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return {}
+    parsed = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        index, prompt = entry.get("id"), entry.get("prompt")
+        if type(index) is int and 0 <= index < count and isinstance(prompt, str) and prompt.strip():
+            parsed.setdefault(index, prompt.strip())
+    return parsed
+
+
+async def _enhance_pack(client, limiter, semaphore, pack, max_retries, use_cache):
+    """一次请求增强一包提示词，解析失败或缺失的条目改为逐条请求
+
+    认证、权限、请求无效、额度用尽的错误直接抛出；其他请求错误记在包内每个条目上。
+
+    Returns:
+        [(id, 增强结果, 错误)]，与 pack 顺序一致
+    """
+    if len(pack) == 1:
+        pending = list(pack)
+        results = {}
+    else:
+        cache = get_response_cache()
+        results = {}
+        pending = []
+        keys = []
+        for item_id, prompt in pack:
+            key = _enhance_key(prompt)
+            cached = cache.get(key) if use_cache else None
+            if cached is not None:
+                metrics.inc("sora2_openai_cache_hits_total", call="enhance_packed")
+                results[item_id] = (cached, None)
+            else:
+                pending.append((item_id, prompt))
+                keys.append(key)
+
+        parsed = {}
+        if len(pending) > 1:
+            # 包内用 0 起的序号代替 id，短且不会与提示词内容混淆
+            content = PACKED_ENHANCE_USER_TEMPLATE.format(items=json.dumps(
+                [{"id": index, "prompt": prompt} for index, (_, prompt) in enumerate(pending)], ensure_ascii=False
+            ))
+            # 限流按实际输入估算，这里只加预估输出
+            try:
+                text = await _create_with_retries(
+                    client, limiter, semaphore, PACKED_ENHANCE_SYSTEM_PROMPT, content,
+                    sum(_completion_tokens(prompt) for _, prompt in pending), max_retries
+                )
+            except Exception as e:
+                if _is_fatal(e):
+                    # 认证、额度等错误逐条请求同样会失败，停止整批
+                    raise
+                # 重试后仍失败（服务端错误、连接错误），整包记为失败，不再逐条放大请求量
+                for item_id, _ in pending:
+                    results[item_id] = (None, e)
+                return [(item_id, *results[item_id]) for item_id, _ in pack]
+            # 输出被截断、格式不符或缺条目时，解析不到的条目改为逐条请求
+            parsed = parse_packed_response(text, len(pending))
+
+        fallback = []
+        for index, ((item_id, prompt), key) in enumerate(zip(pending, keys)):
+            if index in parsed:
+                cache.set(key, parsed[index])
+                metrics.inc("sora2_openai_packed_items_total", result="packed")
+                results[item_id] = (parsed[index], None)
+            else:
+                metrics.inc("sora2_openai_packed_items_total", result="fallback")
+                fallback.append((item_id, prompt))
+        pending = fallback
+
+    outcomes = await asyncio.gather(
+        *(_enhance_one(client, limiter, semaphore, prompt, max_retries, use_cache) for _, prompt in pending),
+        return_exceptions=True
+    )
+    for (item_id, _), outcome in zip(pending, outcomes):
+        if isinstance(outcome, BaseException):
+            results[item_id] = (None, outcome)
+        else:
+            results[item_id] = (outcome, None)
+    return [(item_id, *results[item_id]) for item_id, _ in pack]
+
+
+async def enhance_batch_async(api_key, items, concurrency=8, rpm=None, tpm=None, max_retries=3, on_result=None, base_url=None, use_cache=True, pack_size=1):
+    """并发增强一批提示词
+
+    Args:
+        api_key: OpenAI API Key
+        items: 可迭代的 (id, 提示词)
+        concurrency: 同时进行的请求数上限（打包请求和逐条回退请求一样各占一个名额）
+        rpm: 每分钟请求数上限
+        tpm: 每分钟token数上限（按本地估算）
+        max_retries: 每次请求的重试次数
+        on_result: 每条完成时回调 on_result(id, 增强结果, 错误)，按完成顺序调用
+        base_url: 兼容 OpenAI 协议的服务地址（默认官方接口）
+        use_cache: 是否读取响应缓存
+        pack_size: 每次请求最多打包的提示词条数，1 表示逐条请求
+
+    Returns:
+        id -> 增强结果（失败的条目不包含在内）
+    """
+    limiter = RateLimiter(rpm, tpm)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    packs = pack_prompts(items, pack_size) if pack_size > 1 else [[item] for item in items]
+
+    # 异步连接池绑定事件循环，每批次独立创建，但同样启用 keep-alive 和 HTTP/2
+    import httpx
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(limits=_pool_limits(), http2=HTTP2, timeout=60.0)
+    async with AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0, http_client=http_client) as client:
+        tasks = [asyncio.create_task(_enhance_pack(client, limiter, semaphore, pack, max_retries, use_cache)) for pack in packs]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for item_id, text, error in await finished:
+                    if error is None:
+                        results[item_id] = text
+                    if on_result:
+                        on_result(item_id, text, error)
+        finally:
+            # 认证、额度等错误使整批停止时，取消其余请求
+            for task in tasks:
+                task.cancel()
+
+    return results
+
+
+def enhance_batch(api_key, items, **kwargs):
+    """enhance_batch_async 的同步入口，供 Streamlit 脚本直接调用"""
+    return asyncio.run(enhance_batch_async(api_key, items, **kwargs))
@@ -3,37 +3,180 @@ from templates import (
     TEMPLATES, COUNTRIES, AD_TYPES, VISUAL_STYLES,
     CAMERA_TECHNIQUES, TONES, DIRECTOR_STYLES, DURATIONS,
     CAMERA_LANGUAGE, PHYSICS_EFFECTS, AUDIO_SUGGESTIONS,
-    TIMING_RHYTHM, INDUSTRY_TYPES
+    INDUSTRY_TYPES, TEMPLATE_OPTIONS, INDUSTRY_OPTIONS,
+    CAMERA_SPEED_OPTIONS, WEATHER_OPTIONS, MUSIC_TYPE_OPTIONS, RHYTHM_OPTIONS,
+    RHYTHM_PATTERN_OPTIONS, SHOT_TRANSITION_OPTIONS, SWEEP_AXES
 )
-from openai import OpenAI
+from generator import LivePreview, render_prompt
+from batch import (
+    BATCH_WORKERS, MAX_BATCH_SIZE, PARALLEL_MIN_ROWS, CombinationIds, estimate_batch_size,
+    iter_batch, iter_batch_shards, split_variables
+)
+from batch_store import BatchStore
+from sampling import SAMPLING_STRATEGIES, SIZED_STRATEGIES, estimate_sample_size, iter_sample, sample_indices
+from exporters import EXPORT_FORMATS, batch_hash, export_prompts, remove_export, touch_export
+from history import get_history
+from dedup import (
+    DEFAULT_THRESHOLD, cluster_near_duplicates, minhash_signatures,
+    rank_by_diversity, representatives
+)
+import metrics
+from ai import (
+    ENHANCE_SYSTEM_PROMPT, ENHANCE_USER_TEMPLATE, MAX_PACK_SIZE, OPTIMIZE_SYSTEM_PROMPT,
+    OPTIMIZE_USER_TEMPLATE, QUICK_SYSTEM_PROMPT, QUICK_USER_TEMPLATE,
+    chat_completion, stream_chat_completion
+)
+from jobs import INTERRUPTED, RUNNING, STATUS_LABELS, get_job_queue, start_job
+from tasks import (
+    CANCELLED as TASK_CANCELLED, DONE as TASK_DONE, FAILED as TASK_FAILED,
+    format_progress, submit as submit_task
+)
+import numpy as np
 import os
-import json
+import random
+import time
 from datetime import datetime
-import itertools
 
-# Helper function to initialize OpenAI client safely
-def create_openai_client(api_key):
+# 本次脚本运行的起始时间，用于统计整页重跑耗时
+run_started = time.perf_counter()
+
+def start_export(batch, export_format):
+    """提交当前批次、指定格式的导出任务（用户点击导出时调用），导出文件在任务结果中
+
+    每个批次只保留一个导出，旧的导出被取消并删除文件。
     """
-    Create OpenAI client with proper configuration.
-    Handles proxy settings properly for OpenAI v1.0+
+    release_batch_export(batch)
+    store = batch['store']
+    task = submit_task(
+        f"导出 {export_format}", batch['total'],
+        lambda task: export_prompts(task.track(store.iter_rows()), export_format)
+    )
+    batch['export'] = (export_format, task)
+    return task
+
+def release_batch_export(batch):
+    """移出批次的导出并删除导出文件；仍在执行的导出任务先取消，结束后再删除"""
+    export = batch.pop('export', None)
+    if export is None:
+        return
+    task = export[1]
+    task.cancel()
+    task.add_done_callback(lambda task: remove_export(task.result[0]) if task.status == TASK_DONE else None)
+
+def discard_batch(batch):
+    """丢弃批次：取消仍在执行的生成/导出任务，全部结束后再删除存储文件"""
+    tasks = [batch['task']] + ([batch['export'][1]] if batch.get('export') else [])
+    release_batch_export(batch)
+
+    def close_when_idle(_task):
+        # close() 可重复调用，多个回调同时判断为全部结束也没有问题
+        if all(task.finished for task in tasks):
+            batch['store'].close()
+
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        task.add_done_callback(close_when_idle)
+
+def drop_export(state_key):
+    """下载后删除导出文件并移出会话"""
+    export = st.session_state.pop(state_key, None)
+    if export is not None:
+        remove_export(export[1])
+
+def export_download(label, load_rows, export_format, state_key, prefix, version=None):
+    """按需导出：点击后生成导出文件并显示下载按钮，下载后删除文件
+
+    会话中只保存文件路径，不保存导出内容；格式或 version 变化后旧文件作废。
+
+    Args:
+        load_rows: 无参函数，返回要导出的提示词记录
+        prefix: 下载文件名前缀，替换默认的 sora2_prompts_
     """
-    # Remove any proxy-related environment variables that might interfere
-    # OpenAI v1.0+ uses httpx which respects HTTP_PROXY/HTTPS_PROXY env vars
-    # but doesn't accept 'proxies' as a constructor parameter
-    try:
-        client = OpenAI(
-            api_key=api_key,
-            max_retries=2,
-            timeout=30.0
+    export = st.session_state.get(state_key)
+    # 每次显示时更新修改时间；文件已被清理时重新导出
+    if export is not None and (export[0] != (export_format, version) or not touch_export(export[1])):
+        drop_export(state_key)
+        export = None
+    if export is None:
+        if not st.button(f"📦 {label}", key=f"{state_key}_prepare", use_container_width=True):
+            return
+        path, filename, mime = export_prompts(load_rows(), export_format)
+        export = st.session_state[state_key] = ((export_format, version), path, filename.replace("sora2_prompts_", prefix), mime)
+    _, path, filename, mime = export
+    with open(path, "rb") as f:
+        st.download_button(
+            label=f"📥 下载 {filename}", data=f, file_name=filename, mime=mime,
+            key=f"{state_key}_download", on_click=drop_export, args=(state_key,), use_container_width=True
         )
-        return client
-    except TypeError as e:
-        if "proxies" in str(e):
-            # If proxies parameter is being passed incorrectly, try with minimal config
-            client = OpenAI(api_key=api_key)
-            return client
-        else:
-            raise
+
+@st.fragment(run_every=0.5)
+def task_progress_panel(task, key):
+    """后台任务的进度（条数、速度、预计剩余时间）和取消按钮；任务结束后整页重跑以显示结果"""
+    if task.finished:
+        st.rerun()
+    st.progress(min(task.done / task.total, 1.0) if task.total else 0.0, text=format_progress(task))
+    if task.cancelled:
+        st.caption("正在取消...")
+    elif st.button("⏹️ 取消", key=key, use_container_width=True):
+        task.cancel()
+
+def show_run_time(started, label):
+    """显示从 started 到现在的耗时"""
+    st.caption(f"⏱️ {label}耗时 {(time.perf_counter() - started) * 1000:.1f} ms")
+
+def batch_variables():
+    """批量变量：内容变量与参数扫描维度合并"""
+    return {**st.session_state.get('variables', {}), **st.session_state.get('sweep', {})}
+
+def save_history(prompt, kind, template=None, params=None):
+    """保存到提示词历史；历史库写入失败不影响生成结果"""
+    try:
+        get_history().add(prompt, kind, template=template, params=params)
+    except Exception as e:
+        st.warning(f"⚠️ 保存历史记录失败: {str(e)}")
+
+@st.fragment
+def history_panel(result_key):
+    """历史提示词搜索，选中的提示词可直接载入结果区"""
+    started = time.perf_counter()
+    query = st.text_input("🔍 搜索历史提示词", placeholder="例如：长沙 臭豆腐", key="history_query")
+    records = get_history().search(query, limit=10)
+    if not records:
+        st.caption("没有找到历史提示词")
+    for record in records:
+        title = f"{datetime.fromtimestamp(record['created_at']).strftime('%m-%d %H:%M')} · {record['kind']} · {record['prompt'][:16]}…"
+        with st.expander(title):
+            if record['template']:
+                st.caption(f"模板：{record['template']}")
+            st.code(record['prompt'], language="text")
+            if st.button("↩️ 载入结果区", key=f"history_use_{record['id']}", use_container_width=True):
+                st.session_state[result_key] = record['prompt']
+                st.rerun()
+    show_run_time(started, "历史搜索")
+
+@st.fragment
+def enhance_jobs_panel(api_key):
+    """最近的增强任务：刷新页面或服务重启后在这里查看结果、继续执行"""
+    queue = get_job_queue()
+    job_ids = queue.recent(5)
+    if not job_ids:
+        st.caption("暂无增强任务")
+    for job_id in job_ids:
+        job = queue.get(job_id)
+        progress = queue.progress(job_id)
+        with st.expander(f"{job['label'] or job_id[:8]} · {STATUS_LABELS[progress['status']]} · {progress['done']}/{progress['total']}"):
+            if progress['failed']:
+                st.caption(f"失败 {progress['failed']} 条")
+            if progress['status'] != RUNNING and progress['done'] < progress['total']:
+                if st.button("▶️ 继续", key=f"job_resume_{job_id}", use_container_width=True, disabled=not api_key):
+                    start_job(job_id, api_key, on_result=lambda item_id, text: get_history().add(text, "AI批量增强"))
+                    st.rerun(scope="fragment")
+            if progress['done'] and progress['status'] != RUNNING:
+                export_download(
+                    "导出结果", lambda job_id=job_id: queue.results(job_id), st.session_state.get('export_format', 'TXT'),
+                    f"job_export_{job_id}", "sora2_enhanced_", version=progress['updated_at']
+                )
 
 # 页面配置
 st.set_page_config(
@@ -97,9 +240,35 @@ with st.sidebar:
             if var_values:
                 st.session_state.variables[var_name] = [v.strip() for v in var_values.split('\n') if v.strip()]
 
+        # 参数扫描：把控制参数作为批量维度，每个取值生成一组提示词
+        st.markdown("---")
+        st.subheader("🎛️ 参数扫描")
+        sweep_axes = st.multiselect(
+            "扫描维度",
+            list(SWEEP_AXES),
+            help="选中的控制参数依次取每个值，替代左侧对应控件的设置；多选控件每次只取一个选项"
+        )
+        sweep = {}
+        for axis in sweep_axes:
+            options = SWEEP_AXES[axis][1]
+            sweep[axis] = st.multiselect(f"{axis} 取值", options, default=options, key=f"sweep_{axis}")
+        st.session_state.sweep = {axis: values for axis, values in sweep.items() if values}
+
+        # 抽样：组合空间很大时只生成有代表性的一部分
+        st.markdown("---")
+        sampling_strategy = st.selectbox(
+            "抽样方式",
+            list(SAMPLING_STRATEGIES),
+            help="均匀随机：随机抽取指定条数 | 分层：每个变量的每个取值都至少出现一次 | 两两组合覆盖：任意两个变量的取值搭配都至少出现一次"
+        )
+        sample_size = 200
+        if sampling_strategy in SIZED_STRATEGIES:
+            sample_size = st.number_input("抽样条数", min_value=1, max_value=MAX_BATCH_SIZE, value=200)
+        st.session_state.sampling = (sampling_strategy, sample_size)
+
         # 导出格式选择
         st.markdown("---")
-        export_format = st.selectbox("导出格式", ["TXT", "CSV", "JSON"])
+        export_format = st.selectbox("导出格式", list(EXPORT_FORMATS))
         st.session_state.export_format = export_format
 
     st.markdown("---")
@@ -115,8 +284,9 @@ with st.sidebar:
         st.markdown("""
         1. 配置变量槽位和值
         2. 在提示词中使用 {变量名}
-        3. 点击批量生成
-        4. 导出所有组合结果
+        3. （可选）选择参数扫描维度、抽样方式
+        4. 点击批量生成
+        5. 导出所有组合结果
         """)
     else:  # AI快速生成
         st.markdown("""
@@ -128,6 +298,16 @@ with st.sidebar:
         "做一个长沙臭豆腐的街头广告，10秒，黑白风格，快节奏"
         """)
 
+    # 历史记录：已生成的提示词可直接复用，无需再次调用AI
+    st.markdown("---")
+    st.header("🕘 历史记录")
+    history_panel('ai_quick_prompt' if generation_mode == "🤖 AI快速生成" else 'generated_prompt')
+
+    # AI批量增强任务：在后台执行，页面刷新后仍可查看和继续
+    st.markdown("---")
+    st.header("🗂️ 增强任务")
+    enhance_jobs_panel(api_key)
+
 # 主界面 - 根据模式显示不同内容
 if generation_mode == "🤖 AI快速生成":
     # AI快速生成界面（全宽布局）
@@ -165,79 +345,75 @@ if generation_mode == "🤖 AI快速生成":
     st.markdown("###  ")
     ai_gen_btn = st.button("🎬 AI生成提示词", type="primary", use_container_width=True, disabled=not (api_key and user_requirement))
 
-    # 处理生成
+    # 处理生成：流式输出，完成后直接写入 session_state，无需整页重跑
     if ai_gen_btn and api_key and user_requirement:
-        with st.spinner("AI生成中...请稍候"):
-            try:
-                client = create_openai_client(api_key)
-
-                system_prompt = """你是专业的Sora2视频提示词专家。
-
-用户会用一句话描述他们的需求，你需要将其转换为完整、详细、专业的Sora2视频生成提示词。
-
-提示词要求：
-1. 包含时长、场景、主体、动作等基础信息
-2. 详细描述镜头语言（镜头类型、运镜方式、景深等）
-3. 描述视觉风格和色调氛围
-4. 如果适用，添加光影效果、粒子效果、音频建议等
-5. 语言要具体、生动、适合AI理解
-6. 长度适中（200-400字）
-
-直接输出提示词，不要解释或其他内容。"""
-
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"需求：{user_requirement}"}
-                    ],
-                    temperature=0.7
-                )
-
-                generated_prompt = response.choices[0].message.content
-                st.session_state['ai_quick_prompt'] = generated_prompt
-                st.rerun()
-
-            except Exception as e:
-                st.error(f"❌ 生成失败: {str(e)}")
+        stream_slot = st.empty()
+        try:
+            with stream_slot.container():
+                generated_prompt = st.write_stream(stream_chat_completion(
+                    api_key, QUICK_SYSTEM_PROMPT, QUICK_USER_TEMPLATE.format(requirement=user_requirement)
+                ))
+            st.session_state['ai_quick_prompt'] = generated_prompt
+            st.session_state['ai_quick_requirement'] = user_requirement
+            save_history(generated_prompt, "AI快速生成", params={"requirement": user_requirement})
+            stream_slot.empty()
+        except Exception as e:
+            stream_slot.empty()
+            st.error(f"❌ 生成失败: {str(e)}")
 
     # 显示生成结果
     if 'ai_quick_prompt' in st.session_state:
         st.markdown("---")
         st.markdown("### 🎉 生成的提示词")
 
-        prompt_text = st.text_area(
-            "AI生成的提示词",
-            value=st.session_state['ai_quick_prompt'],
-            height=350,
-            label_visibility="collapsed"
-        )
+        # 结果区占位：流式输出时逐段显示，完成后替换为文本框
+        result_slot = st.empty()
 
         # 操作按钮
         col_act1, col_act2, col_act3 = st.columns(3)
         with col_act1:
-            if st.button("✨ AI优化", use_container_width=True):
-                with st.spinner("优化中..."):
-                    try:
-                        client = create_openai_client(api_key)
-                        response = client.chat.completions.create(
-                            model="gpt-4",
-                            messages=[
-                                {"role": "system", "content": "你是Sora2提示词专家。优化用户提供的提示词，使其更生动、更具体、更适合AI视频生成。"},
-                                {"role": "user", "content": f"请优化以下提示词：\n\n{st.session_state['ai_quick_prompt']}"}
-                            ],
-                            temperature=0.7
-                        )
-                        st.session_state['ai_quick_prompt'] = response.choices[0].message.content
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"优化失败: {str(e)}")
-
+            optimize_btn = st.button("✨ AI优化", use_container_width=True)
         with col_act2:
-            if st.button("🔄 重新生成", use_container_width=True):
-                if 'ai_quick_prompt' in st.session_state:
-                    del st.session_state['ai_quick_prompt']
+            regenerate_btn = st.button("🔄 重新生成", use_container_width=True)
+
+        stream_request = None
+        if optimize_btn:
+            stream_request = (
+                OPTIMIZE_SYSTEM_PROMPT,
+                OPTIMIZE_USER_TEMPLATE.format(prompt=st.session_state['ai_quick_prompt']),
+                True, "优化失败", "AI优化"
+            )
+        elif regenerate_btn:
+            # 重新生成：跳过缓存，重新请求同一需求
+            requirement = st.session_state.get('ai_quick_requirement')
+            if not requirement:
+                del st.session_state['ai_quick_prompt']
                 st.rerun()
+            stream_request = (
+                QUICK_SYSTEM_PROMPT, QUICK_USER_TEMPLATE.format(requirement=requirement),
+                False, "❌ 生成失败", "AI快速生成"
+            )
+
+        if stream_request:
+            system_prompt, user_content, use_cache, error_label, history_kind = stream_request
+            try:
+                with result_slot.container():
+                    st.session_state['ai_quick_prompt'] = st.write_stream(
+                        stream_chat_completion(api_key, system_prompt, user_content, use_cache=use_cache)
+                    )
+                save_history(
+                    st.session_state['ai_quick_prompt'], history_kind,
+                    params={"requirement": st.session_state.get('ai_quick_requirement')}
+                )
+            except Exception as e:
+                st.error(f"{error_label}: {str(e)}")
+
+        prompt_text = result_slot.text_area(
+            "AI生成的提示词",
+            value=st.session_state['ai_quick_prompt'],
+            height=350,
+            label_visibility="collapsed"
+        )
 
         with col_act3:
             st.download_button(
@@ -262,10 +438,9 @@ with col1:
     st.subheader("1. 模板与基础设置")
 
     # 模板选择
-    template_options = ["自定义"] + list(TEMPLATES.keys())
     selected_template = st.selectbox(
         "预设模板",
-        template_options,
+        TEMPLATE_OPTIONS,
         help="选择一个预设模板或自定义创建"
     )
 
@@ -301,7 +476,7 @@ with col1:
     # 行业类型选择
     col_ind1, col_ind2 = st.columns(2)
     with col_ind1:
-        industry_type = st.selectbox("行业类型", ["不限"] + list(INDUSTRY_TYPES.keys()))
+        industry_type = st.selectbox("行业类型", INDUSTRY_OPTIONS)
     with col_ind2:
         if industry_type != "不限":
             industry_subtype = st.selectbox("具体类型", INDUSTRY_TYPES[industry_type])
@@ -322,7 +497,7 @@ with col1:
             camera_movement = st.multiselect("运镜方式", CAMERA_LANGUAGE["运镜方式"])
         with col_cam2:
             depth_of_field = st.multiselect("景深效果", CAMERA_LANGUAGE["景深效果"])
-            camera_speed = st.selectbox("镜头速度", ["不限"] + CAMERA_LANGUAGE["镜头速度"])
+            camera_speed = st.selectbox("镜头速度", CAMERA_SPEED_OPTIONS)
 
         st.markdown("---")
 
@@ -333,7 +508,7 @@ with col1:
             lighting = st.multiselect("光影效果", PHYSICS_EFFECTS["光影效果"])
             particles = st.multiselect("粒子效果", PHYSICS_EFFECTS["粒子效果"])
         with col_phy2:
-            weather = st.selectbox("天气氛围", ["不限"] + PHYSICS_EFFECTS["天气氛围"])
+            weather = st.selectbox("天气氛围", WEATHER_OPTIONS)
             physics_sim = st.multiselect("物理模拟", PHYSICS_EFFECTS["物理模拟"])
 
         st.markdown("---")
@@ -342,10 +517,10 @@ with col1:
         st.markdown("### 🎵 音频建议")
         col_aud1, col_aud2 = st.columns(2)
         with col_aud1:
-            music_type = st.selectbox("音乐类型", ["不限"] + AUDIO_SUGGESTIONS["音乐类型"])
+            music_type = st.selectbox("音乐类型", MUSIC_TYPE_OPTIONS)
             sound_effects = st.multiselect("音效建议", AUDIO_SUGGESTIONS["音效建议"])
         with col_aud2:
-            rhythm = st.selectbox("节奏匹配", ["不限"] + AUDIO_SUGGESTIONS["节奏匹配"])
+            rhythm = st.selectbox("节奏匹配", RHYTHM_OPTIONS)
 
         st.markdown("---")
 
@@ -353,9 +528,9 @@ with col1:
         st.markdown("### ⏱️ 时长节奏")
         col_tim1, col_tim2 = st.columns(2)
         with col_tim1:
-            rhythm_pattern = st.selectbox("节奏分段", ["不限"] + TIMING_RHYTHM["节奏分段"])
+            rhythm_pattern = st.selectbox("节奏分段", RHYTHM_PATTERN_OPTIONS)
         with col_tim2:
-            shot_transition = st.selectbox("镜头切换", ["不限"] + TIMING_RHYTHM["镜头切换"])
+            shot_transition = st.selectbox("镜头切换", SHOT_TRANSITION_OPTIONS)
 
     st.markdown("---")
 
@@ -373,6 +548,389 @@ with col1:
         height=100
     )
 
+# 当前界面控件取值，供提示词渲染使用
+settings = {
+    "selected_template": selected_template,
+    "country": country,
+    "location": location,
+    "duration": duration,
+    "visual_style": visual_style,
+    "camera_technique": camera_technique,
+    "tone": tone,
+    "director_style": director_style,
+    "industry_type": industry_type,
+    "industry_subtype": industry_subtype,
+    "camera_type": camera_type,
+    "camera_movement": camera_movement,
+    "depth_of_field": depth_of_field,
+    "camera_speed": camera_speed,
+    "lighting": lighting,
+    "particles": particles,
+    "weather": weather,
+    "physics_sim": physics_sim,
+    "music_type": music_type,
+    "sound_effects": sound_effects,
+    "rhythm": rhythm,
+    "rhythm_pattern": rhythm_pattern,
+    "shot_transition": shot_transition,
+    "brand_name": brand_name,
+    "theme": theme,
+    "slogan": slogan,
+    "scene_description": scene_description,
+}
+
+# ========== 结果区片段：片段内的组件交互只重跑该片段，不重跑整个页面 ==========
+
+@st.fragment
+def single_result_panel():
+    """单个生成结果区"""
+    started = time.perf_counter()
+    if 'generated_prompt' in st.session_state:
+        st.markdown("### 生成的提示词：")
+
+        # 文本框显示
+        result_text = st.text_area(
+            "提示词内容",
+            value=st.session_state['generated_prompt'],
+            height=400,
+            label_visibility="collapsed"
+        )
+
+        # 复制按钮
+        st.code(st.session_state['generated_prompt'], language="text")
+        st.success("✅ 提示词已生成！请复制上方文本使用。")
+
+        # 统计信息
+        st.caption(f"字数统计: {len(st.session_state['generated_prompt'])} 字符")
+    else:
+        st.info("👈 请在左侧配置参数后点击生成按钮")
+    show_run_time(started, "结果区")
+
+def open_batch(batch, fixed=None):
+    """打开批次结果（磁盘存储）的筛选视图
+
+    全部组合的批次按组合下标直接算出筛选后的 id；抽样批次的 id 按样本顺序编号，只能在存储中筛选。
+    """
+    ids = None if batch['sampling'] else CombinationIds(batch['variables'], fixed or {})
+    return batch['store'].view(fixed, ids=ids)
+
+@st.fragment
+def batch_browser_panel():
+    """批量结果浏览：按变量值筛选 / 文字搜索，分页按需渲染"""
+    started = time.perf_counter()
+    batch = st.session_state['batch_job']
+    total = batch['total']
+    st.success(f"✅ 已生成 {total} 个提示词！")
+    if batch['inert']:
+        st.caption(f"ℹ️ 已合并重复组合：每个提示词对应 {estimate_batch_size(batch['inert']):,} 个原始组合（{'、'.join(batch['inert'])} 的取值以列表记录）")
+
+    st.markdown("### 📋 结果浏览：")
+    # 组件 key 带批次哈希，同一批次内翻页时保持稳定
+    key_prefix = f"browse_{batch['hash'][:12]}"
+
+    # 按变量值筛选
+    fixed = {}
+    if batch['variables']:
+        filter_cols = st.columns(len(batch['variables']))
+        for col, (name, values) in zip(filter_cols, batch['variables'].items()):
+            with col:
+                choice = st.selectbox(name, ["全部"] + values, key=f"{key_prefix}_filter_{name}")
+                if choice != "全部":
+                    fixed[name] = choice
+
+    col_q, col_size = st.columns([3, 1])
+    with col_q:
+        query = st.text_input("🔍 提示词包含", key=f"{key_prefix}_query")
+    with col_size:
+        page_size = st.selectbox("每页条数", [5, 10, 20, 50], key=f"{key_prefix}_page_size")
+
+    view = open_batch(batch, fixed)
+    view_key = f"{key_prefix}_{abs(hash((tuple(sorted(fixed.items())), query, page_size)))}"
+
+    if query:
+        # 增量搜索：只查到当前页所需的匹配数，每次重跑最多扫描 SEARCH_SCAN_ROWS 条；
+        # 已找到的 id 和续查位置保存在 session_state
+        search = st.session_state.get(f"{key_prefix}_search")
+        if not search or search['key'] != view_key:
+            search = {'key': view_key, 'matches': [], 'cursor': 0}
+            st.session_state[f"{key_prefix}_search"] = search
+        page = st.number_input("页码", min_value=1, value=1, key=f"{view_key}_page")
+        needed = page * page_size
+        if len(search['matches']) < needed and search['cursor'] is not None:
+            matches, search['cursor'] = view.search(query, after_id=search['cursor'], limit=needed - len(search['matches']))
+            search['matches'].extend(matches)
+        page_rows = batch['store'].get_many(search['matches'][(page - 1) * page_size:needed])
+        if search['cursor'] is None:
+            st.caption(f"共找到 {len(search['matches']):,} 条")
+        elif len(search['matches']) < needed:
+            st.caption(f"已找到 {len(search['matches']):,} 条，已查找到 #{search['cursor']:,}")
+            st.button("🔎 继续查找", key=f"{view_key}_continue")
+        else:
+            st.caption(f"已找到 {len(search['matches']):,} 条，翻页继续查找")
+    else:
+        pages = max(1, -(-len(view) // page_size))
+        page = st.number_input(f"页码（共 {pages:,} 页）", min_value=1, max_value=pages, value=1, key=f"{view_key}_page")
+        page_rows = view.rows((page - 1) * page_size, page * page_size)
+        st.caption(f"筛选结果 {len(view):,} 条")
+
+    for p in page_rows:
+        st.markdown(f"**提示词 #{p['id']}**")
+        st.caption(f"变量: {p['variables']}")
+        st.text_area(
+            f"prompt_{p['id']}",
+            value=p['prompt'],
+            height=150,
+            label_visibility="collapsed",
+            key=f"{key_prefix}_row_{p['id']}"
+        )
+        st.markdown("---")
+
+    if not page_rows:
+        st.info("没有符合条件的提示词")
+    show_run_time(started, "浏览区")
+
+@st.fragment
+def batch_export_panel():
+    """批量结果导出：点击后在后台任务中生成导出文件，下载后删除"""
+    started = time.perf_counter()
+    batch = st.session_state['batch_job']
+    export_format = st.session_state.get('export_format', 'TXT')
+
+    # 导出按钮
+    st.markdown("### 📥 导出选项：")
+    export = batch.get('export')
+    stale = export is not None and export[1].status == TASK_DONE and not touch_export(export[1].result[0])
+    if export is not None and (export[0] != export_format or stale):
+        release_batch_export(batch)
+        export = None
+
+    if export is None:
+        if st.button(f"📦 导出为 {export_format}", use_container_width=True):
+            start_export(batch, export_format)
+            # 进度区在片段之外，整页重跑一次使其出现
+            st.rerun()
+    elif export[1].status == TASK_DONE:
+        path, filename, mime = export[1].result
+        with open(path, "rb") as f:
+            st.download_button(
+                label=f"📥 下载 {filename}",
+                data=f,
+                file_name=filename,
+                mime=mime,
+                on_click=release_batch_export,
+                args=(batch,),
+                use_container_width=True
+            )
+    else:
+        if export[1].status == TASK_FAILED:
+            st.error(f"❌ 导出失败: {str(export[1].error)}")
+        else:
+            st.info("导出已取消")
+        if st.button("🔄 重新导出", use_container_width=True):
+            start_export(batch, export_format)
+            st.rerun()
+
+    # 统计信息
+    st.caption(f"共生成 {batch['total']} 个提示词 | 总字数: {batch['total_chars']} 字符")
+    show_run_time(started, "导出区")
+
+# 近似去重最多处理的条数（签名矩阵约 512 字节/条，保存在会话中）
+DEDUP_MAX_ROWS = 100_000
+
+@st.fragment
+def batch_dedup_panel():
+    """近似去重：对批量结果或AI增强结果聚类，每类保留一条或按多样性挑选"""
+    batch = st.session_state['batch_job']
+    store = batch['store']
+    export_format = st.session_state.get('export_format', 'TXT')
+    key_prefix = f"dedup_{batch['hash'][:12]}"
+
+    st.markdown("### 🧹 近似去重：")
+    col_src, col_th = st.columns(2)
+    with col_src:
+        source = st.radio("去重对象", ["批量结果", "AI增强结果"], horizontal=True, key=f"{key_prefix}_source")
+    with col_th:
+        threshold = st.slider(
+            "相似度阈值", min_value=0.80, max_value=1.0, value=DEFAULT_THRESHOLD, step=0.01,
+            help="两条提示词的字符相似度（3字片段的 Jaccard 相似度估计）不低于该值视为近似重复",
+            key=f"{key_prefix}_threshold"
+        )
+
+    def load_rows(ids):
+        if source == "批量结果":
+            return store.get_many(ids)
+        by_id = {p['id']: p for p in store.enhanced_rows()}
+        return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+    result_key = (batch['hash'], source, threshold)
+    if st.button("🔍 检测近似重复", use_container_width=True, key=f"{key_prefix}_run"):
+        started = time.perf_counter()
+        if source == "批量结果":
+            rows = store.view().rows(0, DEDUP_MAX_ROWS)
+        else:
+            rows = store.enhanced_rows()[:DEDUP_MAX_ROWS]
+        ids = [p['id'] for p in rows]
+        signatures = minhash_signatures([p['prompt'] for p in rows])
+        labels = cluster_near_duplicates(signatures, threshold)
+        st.session_state['dedup_result'] = {
+            'key': result_key,
+            'ids': ids,
+            'signatures': signatures,
+            'labels': labels,
+            'representatives': representatives(labels),
+            'seconds': time.perf_counter() - started,
+        }
+        drop_export(f"{key_prefix}_keep")
+        drop_export(f"{key_prefix}_diverse")
+
+    result = st.session_state.get('dedup_result')
+    if not result or result['key'] != result_key:
+        return
+    total = len(result['ids'])
+    if not total:
+        st.info("没有可去重的提示词")
+        return
+    kept = result['representatives']
+    note = f"，仅处理前 {DEDUP_MAX_ROWS:,} 条" if total >= DEDUP_MAX_ROWS else ""
+    st.caption(f"共 {total:,} 条，聚为 {len(kept):,} 组，可去掉 {total - len(kept):,} 条近似重复（耗时 {result['seconds']:.2f} 秒{note}）")
+
+    # 最大的几组近似重复
+    labels = result['labels']
+    cluster_sizes = np.bincount(labels, minlength=total)
+    largest = [label for label in np.argsort(-cluster_sizes)[:5] if cluster_sizes[label] > 1]
+    if largest:
+        examples = load_rows([result['ids'][label] for label in largest])
+        st.dataframe(
+            [{"ID": p['id'], "同组条数": int(cluster_sizes[label]), "提示词": p['prompt'][:80]} for label, p in zip(largest, examples)],
+            use_container_width=True, hide_index=True
+        )
+
+    col_keep, col_rank = st.columns(2)
+    with col_keep:
+        export_download(
+            f"每组保留一条（{len(kept):,} 条）", lambda: load_rows([result['ids'][i] for i in kept]),
+            export_format, f"{key_prefix}_keep", "sora2_dedup_", version=result_key
+        )
+    with col_rank:
+        diverse_count = st.number_input("按多样性挑选条数", min_value=1, max_value=len(kept), value=min(len(kept), 50), key=f"{key_prefix}_diverse_count")
+        export_download(
+            f"导出多样性最高的 {diverse_count} 条",
+            lambda: load_rows([result['ids'][i] for i in rank_by_diversity(result['signatures'], diverse_count, kept)]),
+            export_format, f"{key_prefix}_diverse", "sora2_diverse_", version=(result_key, diverse_count)
+        )
+
+@st.fragment
+def batch_enhance_panel(api_key):
+    """AI批量增强：提交为后台任务，结果逐条写入任务库"""
+    batch = st.session_state['batch_job']
+    total = batch['total']
+
+    st.markdown("### ✨ AI批量增强：")
+    store = batch['store']
+
+    col_enh1, col_enh2, col_enh3, col_enh4, col_enh5 = st.columns(5)
+    with col_enh1:
+        enhance_count = st.number_input("增强条数", min_value=1, max_value=total, value=min(total, 50))
+    with col_enh2:
+        concurrency = st.number_input("并发数", min_value=1, max_value=64, value=8)
+    with col_enh3:
+        rpm_limit = st.number_input("每分钟请求数", min_value=1, value=500)
+    with col_enh4:
+        tpm_limit = st.number_input("每分钟Token数", min_value=1000, value=150000, step=10000)
+    with col_enh5:
+        pack_size = st.number_input(
+            "每请求条数", min_value=1, max_value=MAX_PACK_SIZE, value=5,
+            help="多条提示词打包在一次请求中增强，按上下文长度自动拆包；解析失败的条目改为逐条请求"
+        )
+
+    enhance_btn = st.button(
+        "✨ AI增强批量结果", use_container_width=True, disabled=not api_key,
+        help="在后台执行，刷新页面不会中断；失败的条目再次点击即可重试，已完成的不会重复请求"
+    )
+
+    if enhance_btn:
+        queue = get_job_queue()
+        params = {'concurrency': concurrency, 'rpm': rpm_limit, 'tpm': tpm_limit, 'pack_size': pack_size}
+        items = [(p['id'], p['variables'], p['prompt']) for p in store.view().rows(0, enhance_count)]
+        template = batch['settings']['selected_template']
+        job_id = batch.get('enhance_job')
+        if job_id is None or queue.get(job_id) is None:
+            job_id = batch['enhance_job'] = queue.create(items, params, label=f"{template} · {datetime.now().strftime('%m-%d %H:%M')}")
+        else:
+            # 同一批次只保留一个任务：追加条目，已完成的保持不变
+            queue.add_items(job_id, items)
+            queue.update_params(job_id, params)
+
+        def sync_result(item_id, text):
+            """在执行线程中调用：同步到本批次存储（供近似去重使用）并保存历史"""
+            store.set_enhanced(item_id, text)
+            variables = store.get_many([item_id])[0]['variables']
+            get_history().add(text, "AI批量增强", template=template, params={**batch['settings'], 'variables': variables})
+
+        start_job(job_id, api_key, on_result=sync_result)
+        # 进度区在片段之外，整页重跑一次使其出现
+        st.rerun()
+
+# 增强结果每页条数
+JOB_PAGE_SIZE = 20
+
+def show_job_progress(progress):
+    """增强任务的进度条和失败/中断提示"""
+    finished = progress['done'] + progress['failed']
+    st.progress(
+        finished / progress['total'] if progress['total'] else 1.0,
+        text=f"{STATUS_LABELS[progress['status']]}：完成 {progress['done']}/{progress['total']}，失败 {progress['failed']}"
+    )
+    if progress['status'] == INTERRUPTED and progress['error']:
+        st.warning(f"⚠️ 任务中断：{progress['error']}，可再次点击增强按钮继续")
+    elif progress['failed'] and progress['status'] != RUNNING:
+        st.warning(f"⚠️ {progress['failed']} 条增强失败，可再次点击重试")
+
+def show_job_rows(rows):
+    st.dataframe(
+        [{"ID": p['id'], "变量": str(p['variables']), "AI增强结果": p['prompt']} for p in rows],
+        use_container_width=True, hide_index=True
+    )
+
+@st.fragment(run_every=1.0)
+def enhance_job_live(job_id):
+    """执行中的增强任务：每秒刷新进度和最新完成的一页结果；结束后整页重跑，改为不轮询的结果区"""
+    queue = get_job_queue()
+    progress = queue.progress(job_id)
+    if progress['status'] != RUNNING:
+        st.rerun()
+    show_job_progress(progress)
+    if progress['done']:
+        st.caption(f"最新完成的 {min(progress['done'], JOB_PAGE_SIZE)} 条")
+        show_job_rows(queue.results(job_id, offset=max(progress['done'] - JOB_PAGE_SIZE, 0)))
+
+@st.fragment
+def enhance_job_results(job_id):
+    """已结束（完成、部分失败或中断）的增强任务：分页查看结果并导出"""
+    queue = get_job_queue()
+    progress = queue.progress(job_id)
+    show_job_progress(progress)
+    if not progress['done']:
+        return
+    pages = -(-progress['done'] // JOB_PAGE_SIZE)
+    page = st.number_input(f"页码（共 {pages:,} 页）", min_value=1, max_value=pages, value=1, key=f"job_page_{job_id}")
+    show_job_rows(queue.results(job_id, offset=(page - 1) * JOB_PAGE_SIZE, limit=JOB_PAGE_SIZE))
+    export_download(
+        f"导出AI增强结果（{progress['done']} 条）", lambda: queue.results(job_id),
+        st.session_state.get('export_format', 'TXT'),
+        f"enhance_export_{job_id}", "sora2_enhanced_", version=progress['updated_at']
+    )
+
+def enhance_job_progress(job_id):
+    """增强任务的进度和已完成结果：执行中每秒刷新，结束后不再轮询"""
+    progress = get_job_queue().progress(job_id)
+    if progress is None:
+        return
+    if progress['status'] == RUNNING:
+        enhance_job_live(job_id)
+    else:
+        enhance_job_results(job_id)
+
 with col2:
     st.header("📄 生成结果")
 
@@ -384,50 +942,28 @@ with col2:
         with col_btn2:
             ai_enhance_btn = st.button("✨ AI增强生成", use_container_width=True, disabled=not api_key)
     else:
-        generate_btn = st.button("🔄 批量生成", type="primary", use_container_width=True)
+        # 生成前预估组合规模：未被当前模板使用的变量不参与组合
+        active_vars, inert_vars = split_variables(settings, batch_variables())
+        raw_size = estimate_batch_size(batch_variables())
+        estimated_size = estimate_batch_size(active_vars) if active_vars else min(raw_size, 1)
+        sampling_strategy, sample_size = st.session_state.get('sampling', ("全部组合", None))
+        for name, values in inert_vars.items():
+            st.warning(f"⚠️ 变量「{name}」在当前模板和设置下不影响提示词，已跳过（{len(values)} 个值不会产生不同的提示词）")
+        # 抽样时上限针对样本量，组合空间本身可以超过上限
+        space_size = estimated_size
+        if SAMPLING_STRATEGIES.get(sampling_strategy):
+            estimated_size = estimate_sample_size(sampling_strategy, active_vars, sample_size)
+        if estimated_size > MAX_BATCH_SIZE:
+            st.error(f"❌ 预计 {estimated_size:,} 个组合，超过上限 {MAX_BATCH_SIZE:,}，请减少变量值")
+        elif SAMPLING_STRATEGIES.get(sampling_strategy):
+            st.caption(f"🎯 {sampling_strategy}：从 {space_size:,} 个组合中抽取约 {estimated_size:,} 个")
+        elif raw_size != estimated_size:
+            st.caption(f"📊 预计生成 {estimated_size:,} 个不同的提示词（原始组合 {raw_size:,} 个）")
+        else:
+            st.caption(f"📊 预计生成 {estimated_size:,} 个组合")
+        generate_btn = st.button("🔄 批量生成", type="primary", use_container_width=True, disabled=estimated_size > MAX_BATCH_SIZE)
         ai_enhance_btn = False
 
-    # 辅助函数：构建精确控制参数文本
-    def build_precise_control_text():
-        """构建精确控制参数的文本"""
-        parts = []
-
-        # 镜头语言
-        if camera_type:
-            parts.append(f"镜头类型：{', '.join(camera_type)}")
-        if camera_movement:
-            parts.append(f"运镜方式：{', '.join(camera_movement)}")
-        if depth_of_field:
-            parts.append(f"景深效果：{', '.join(depth_of_field)}")
-        if camera_speed and camera_speed != "不限":
-            parts.append(f"镜头速度：{camera_speed}")
-
-        # 物理效果
-        if lighting:
-            parts.append(f"光影：{', '.join(lighting)}")
-        if particles:
-            parts.append(f"粒子效果：{', '.join(particles)}")
-        if weather and weather != "不限":
-            parts.append(f"天气：{weather}")
-        if physics_sim:
-            parts.append(f"物理模拟：{', '.join(physics_sim)}")
-
-        # 音频建议
-        if music_type and music_type != "不限":
-            parts.append(f"音乐：{music_type}")
-        if sound_effects:
-            parts.append(f"音效：{', '.join(sound_effects)}")
-        if rhythm and rhythm != "不限":
-            parts.append(f"节奏：{rhythm}")
-
-        # 时长节奏
-        if rhythm_pattern and rhythm_pattern != "不限":
-            parts.append(f"节奏分段：{rhythm_pattern}")
-        if shot_transition and shot_transition != "不限":
-            parts.append(f"镜头切换：{shot_transition}")
-
-        return "\n".join(parts) if parts else ""
-
     # 生成逻辑
     def generate_prompt(use_ai=False, template_vars=None):
         """生成提示词
@@ -436,93 +972,12 @@ with col2:
             use_ai: 是否使用AI增强
             template_vars: 模板变量字典（用于批量生成）
         """
-        # 如果有模板变量，使用它们替换原始值
-        _brand = template_vars.get("品牌", brand_name) if template_vars else brand_name
-        _theme = template_vars.get("主题", theme) if template_vars else theme
-        _slogan = template_vars.get("广告语", slogan) if template_vars else slogan
-        _location = template_vars.get("地点", location) if template_vars else location
-        _scene = template_vars.get("场景", scene_description) if template_vars else scene_description
-
-        # 如果选择了模板
-        if selected_template != "自定义":
-            base_template = TEMPLATES[selected_template]["template"]
-
-            # 替换模板变量
-            prompt = base_template.format(
-                地点=_location or "{地点}",
-                主题=_theme or "{主题}",
-                品牌=_brand or "{品牌}",
-                广告语=_slogan or "{广告语}",
-                国家=country,
-                场景=_scene or "{场景}",
-                场景描述=_scene or "{场景描述}",
-                氛围=tone,
-                镜头特写=", ".join(camera_technique) if camera_technique else "{镜头特写}",
-                旁白风格=tone,
-                广告文案=_slogan or "{广告文案}",
-                主题标语=_slogan or "{主题标语}",
-                KOL="@sama",
-                道具="{道具}",
-                道具2="{道具2}",
-                语言="英语带点亲切的中文味",
-                歌词="{歌词}",
-                地标="{地标}",
-                主体="{主体}",
-                对比场景="{对比场景}",
-                细节动作="{细节动作}",
-                公益主题=_theme or "{公益主题}",
-                公益口号=_slogan or "{公益口号}",
-                动作="{动作}",
-                导演风格=director_style if director_style != "无特定风格" else "{导演风格}",
-                镜头运用=", ".join(camera_technique) if camera_technique else "{镜头运用}",
-                色调氛围=", ".join(visual_style) if visual_style else tone
-            )
-        else:
-            # 自定义生成
-            prompt_parts = [f"{duration}秒视频，{country}{_location}场景。"]
-
-            # 行业类型
-            if industry_type != "不限":
-                prompt_parts.append(f"\n行业类型：{industry_type} - {industry_subtype if industry_subtype else ''}")
-
-            # 视觉风格
-            prompt_parts.append(f"\n视觉风格：{', '.join(visual_style) if visual_style else '自然写实'}")
-            prompt_parts.append(f"镜头运用：{', '.join(camera_technique) if camera_technique else '平稳拍摄'}")
-            prompt_parts.append(f"色调氛围：{tone}")
-
-            if director_style != "无特定风格":
-                prompt_parts.append(f"导演风格：{director_style}")
-
-            # 内容元素
-            prompt_parts.append(f"\n品牌：{_brand or '待定'}")
-            prompt_parts.append(f"主题：{_theme or '待定'}")
-            prompt_parts.append(f"广告语：{_slogan or '待定'}")
-
-            # 场景描述
-            if _scene:
-                prompt_parts.append(f"\n场景描述：{_scene}")
-
-            # 精确控制参数
-            precise_control = build_precise_control_text()
-            if precise_control:
-                prompt_parts.append(f"\n\n【精确控制参数】\n{precise_control}")
-
-            prompt = "\n".join(prompt_parts)
+        prompt = render_prompt(settings, template_vars)
 
         # AI增强
         if use_ai and api_key:
             try:
-                # Use helper function to create OpenAI client safely
-                client = create_openai_client(api_key)
-                response = client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "你是一个专业的Sora2视频提示词专家。请优化和丰富用户提供的提示词，使其更加生动、具体、适合AI视频生成。保持原有风格和核心内容，增加细节描述。"},
-                        {"role": "user", "content": f"请优化以下Sora2提示词：\n\n{prompt}"}
-                    ],
-                    temperature=0.7
-                )
-                prompt = response.choices[0].message.content
+                prompt = chat_completion(api_key, ENHANCE_SYSTEM_PROMPT, ENHANCE_USER_TEMPLATE.format(prompt=prompt))
                 st.success("✅ AI增强完成！")
             except TypeError as e:
                 if "proxies" in str(e):
@@ -536,65 +991,81 @@ with col2:
 
     # 批量生成函数
     def batch_generate():
-        """批量生成提示词"""
-        if not st.session_state.get('variables'):
+        """批量生成提示词，结果写入磁盘存储，返回批次描述（只含元数据和存储句柄）"""
+        if not batch_variables():
             st.error("❌ 请先配置变量")
-            return []
-
-        # 获取所有变量的值
-        var_names = list(st.session_state.variables.keys())
-        var_values = list(st.session_state.variables.values())
-
-        # 生成所有组合
-        all_combinations = list(itertools.product(*var_values))
-
-        prompts = []
-        for idx, combination in enumerate(all_combinations):
-            # 创建变量映射
-            template_vars = dict(zip(var_names, combination))
-
-            # 生成提示词
-            prompt = generate_prompt(use_ai=False, template_vars=template_vars)
-            prompts.append({
-                'id': idx + 1,
-                'variables': template_vars,
-                'prompt': prompt
-            })
-
-        return prompts
-
-    # 导出函数
-    def export_prompts(prompts, format_type):
-        """导出提示词"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        if format_type == "TXT":
-            content = ""
-            for p in prompts:
-                content += f"=" * 80 + "\n"
-                content += f"提示词 #{p['id']}\n"
-                content += f"变量：{p['variables']}\n"
-                content += f"-" * 80 + "\n"
-                content += p['prompt'] + "\n\n"
-            return content, f"sora2_prompts_{timestamp}.txt"
-
-        elif format_type == "CSV":
-            content = "ID,变量,提示词\n"
-            for p in prompts:
-                vars_str = str(p['variables']).replace('"', '""')
-                prompt_str = p['prompt'].replace('"', '""').replace('\n', ' ')
-                content += f'{p["id"]},"{vars_str}","{prompt_str}"\n'
-            return content, f"sora2_prompts_{timestamp}.csv"
-
-        elif format_type == "JSON":
-            content = json.dumps(prompts, ensure_ascii=False, indent=2)
-            return content, f"sora2_prompts_{timestamp}.json"
+            return None
+
+        variables, inert = split_variables(settings, batch_variables())
+        total = estimate_batch_size(variables) if variables else 1
+
+        # 抽样：按组合下标选取，不枚举全部组合
+        sampling_strategy, sample_size = st.session_state.get('sampling', ("全部组合", None))
+        sampling = None
+        indices = None
+        if SAMPLING_STRATEGIES.get(sampling_strategy):
+            sampling = {'strategy': sampling_strategy, 'size': sample_size, 'seed': random.randrange(2 ** 32)}
+            indices = sample_indices(sampling_strategy, variables, sample_size, seed=sampling['seed'])
+            total = len(indices)
+
+        if total > MAX_BATCH_SIZE:
+            st.error(f"❌ 组合数 {total:,} 超过上限 {MAX_BATCH_SIZE:,}")
+            return None
+
+        # 逐条渲染并分块写入磁盘，内存占用与批次大小无关
+        # 大批次按组合下标切分，多进程并行渲染，分片按顺序写入
+        # 大批次在后台任务中执行，页面显示进度并可取消
+        store = BatchStore.create()
+        batch_settings = dict(settings)
+        batch = {
+            'settings': batch_settings,
+            'variables': variables,
+            'inert': inert,
+            'sampling': sampling,
+            'total': total,
+            'total_chars': None,
+            'store': store
+        }
+        batch['hash'] = batch_hash(batch)
+
+        def render(task):
+            with metrics.timer("sora2_batch_seconds"):
+                if indices is not None:
+                    total_chars = store.write(task.track(iter_sample(batch_settings, variables, indices, inert=inert)))
+                elif total >= PARALLEL_MIN_ROWS and BATCH_WORKERS > 1:
+                    total_chars = store.write_encoded(task.track(
+                        iter_batch_shards(batch_settings, variables, inert=inert), size=lambda shard: len(shard[0])
+                    ))
+                else:
+                    total_chars = store.write(task.track(iter_batch(batch_settings, variables, inert=inert)))
+            metrics.observe("sora2_batch_rows", total)
+            batch['total_chars'] = total_chars
+
+        batch['task'] = submit_task("批量生成", total, render)
+        return batch
 
     # 显示生成结果
     if generation_mode == "单个生成":
+        # 实时预览：控件每次变化都会重跑页面，只重新渲染依赖发生变化的分段
+        preview = st.session_state.setdefault('live_preview', LivePreview())
+        started = time.perf_counter()
+        # 单个生成不再调用 render_prompt，预览更新计入同一渲染耗时指标
+        with metrics.timer("sora2_render_seconds"):
+            preview_prompt, rendered = preview.update(settings)
+        preview_us = (time.perf_counter() - started) * 1e6
+        with st.expander("👀 实时预览", expanded=True):
+            st.code(preview_prompt, language="text")
+            preview_diff = preview.diff()
+            if preview_diff:
+                st.caption("与上一版本的差异：")
+                st.code(preview_diff, language="diff")
+            st.caption(f"⏱️ 预览更新耗时 {preview_us:.0f} µs（重新渲染 {rendered} 段）")
+
         if generate_btn:
-            result = generate_prompt(use_ai=False)
+            # 预览已按当前参数渲染完成，直接使用
+            result = preview_prompt
             st.session_state['generated_prompt'] = result
+            save_history(result, "生成", template=selected_template, params=settings)
 
         if ai_enhance_btn:
             if not api_key:
@@ -603,72 +1074,47 @@ with col2:
                 with st.spinner("AI增强生成中..."):
                     result = generate_prompt(use_ai=True)
                     st.session_state['generated_prompt'] = result
+                    # AI增强失败时返回的是未增强的提示词
+                    kind = "生成" if result == preview_prompt else "AI增强"
+                    save_history(result, kind, template=selected_template, params=settings)
 
-        # 显示结果
-        if 'generated_prompt' in st.session_state:
-            st.markdown("### 生成的提示词：")
-
-            # 文本框显示
-            result_text = st.text_area(
-                "提示词内容",
-                value=st.session_state['generated_prompt'],
-                height=400,
-                label_visibility="collapsed"
-            )
-
-            # 复制按钮
-            st.code(st.session_state['generated_prompt'], language="text")
-            st.success("✅ 提示词已生成！请复制上方文本使用。")
-
-            # 统计信息
-            st.caption(f"字数统计: {len(st.session_state['generated_prompt'])} 字符")
-        else:
-            st.info("👈 请在左侧配置参数后点击生成按钮")
+        single_result_panel()
 
     else:  # 批量生成模式
         if generate_btn:
             with st.spinner("批量生成中..."):
-                prompts = batch_generate()
-                if prompts:
-                    st.session_state['batch_prompts'] = prompts
-
-        if 'batch_prompts' in st.session_state:
-            prompts = st.session_state['batch_prompts']
-            st.success(f"✅ 已生成 {len(prompts)} 个提示词！")
-
-            # 显示预览
-            st.markdown("### 📋 生成结果预览：")
-            with st.expander(f"点击查看所有 {len(prompts)} 个提示词", expanded=True):
-                for p in prompts[:5]:  # 只显示前5个
-                    st.markdown(f"**提示词 #{p['id']}**")
-                    st.caption(f"变量: {p['variables']}")
-                    st.text_area(
-                        f"prompt_{p['id']}",
-                        value=p['prompt'],
-                        height=150,
-                        label_visibility="collapsed",
-                        key=f"preview_{p['id']}"
-                    )
-                    st.markdown("---")
-
-                if len(prompts) > 5:
-                    st.info(f"还有 {len(prompts) - 5} 个提示词未显示，请导出查看全部")
-
-            # 导出按钮
-            st.markdown("### 📥 导出选项：")
-            export_format = st.session_state.get('export_format', 'TXT')
-            content, filename = export_prompts(prompts, export_format)
-
-            st.download_button(
-                label=f"📥 导出为 {export_format}",
-                data=content,
-                file_name=filename,
-                mime="text/plain" if export_format != "JSON" else "application/json",
-                use_container_width=True
-            )
-
-            # 统计信息
-            st.caption(f"共生成 {len(prompts)} 个提示词 | 总字数: {sum(len(p['prompt']) for p in prompts)} 字符")
+                batch = batch_generate()
+                if batch:
+                    # 取消旧批次仍在执行的任务，任务结束后删除存储文件
+                    if 'batch_job' in st.session_state:
+                        discard_batch(st.session_state['batch_job'])
+                    st.session_state.pop('dedup_result', None)
+                    st.session_state['batch_job'] = batch
+
+        batch = st.session_state.get('batch_job')
+        if batch and batch['task'].status in (TASK_CANCELLED, TASK_FAILED):
+            if batch['task'].status == TASK_FAILED:
+                st.error(f"❌ 批量生成失败: {str(batch['task'].error)}")
+            else:
+                st.info("批量生成已取消")
+            discard_batch(batch)
+            del st.session_state['batch_job']
+            batch = None
+
+        if batch and not batch['task'].finished:
+            task_progress_panel(batch['task'], f"cancel_batch_{batch['hash'][:12]}")
+        elif batch:
+            batch_browser_panel()
+            export = batch.get('export')
+            if export is not None and not export[1].finished:
+                st.markdown("### 📥 导出选项：")
+                task_progress_panel(export[1], f"cancel_export_{batch['hash'][:12]}")
+            else:
+                batch_export_panel()
+            batch_dedup_panel()
+            batch_enhance_panel(api_key)
+            if batch.get('enhance_job'):
+                enhance_job_progress(batch['enhance_job'])
         else:
             st.info("👈 请先配置变量，然后点击批量生成按钮")
 
@@ -676,7 +1122,15 @@ with col2:
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: gray;'>
-    <p>💡 提示：支持单个生成和批量生成 | 精确控制参数实现专业效果 | 可导出TXT/CSV/JSON格式</p>
+    <p>💡 提示：支持单个生成和批量生成 | 精确控制参数实现专业效果 | 可导出TXT/CSV/JSON/JSONL格式</p>
     <p>🎬 Sora2 创意提示词生成器 v2.0 - 批量生成 + 精确控制</p>
 </div>
 """, unsafe_allow_html=True)
+
+# 整页重跑耗时（最近20次）
+rerun_history = st.session_state.setdefault('rerun_ms', [])
+rerun_history.append((time.perf_counter() - run_started) * 1000)
+metrics.observe("sora2_rerun_seconds", rerun_history[-1] / 1000, mode=generation_mode)
+metrics.flush()
+del rerun_history[:-20]
+st.caption(f"⏱️ 本次页面运行 {rerun_history[-1]:.1f} ms | 最近 {len(rerun_history)} 次平均 {sum(rerun_history) / len(rerun_history):.1f} ms")
@@ -0,0 +1,228 @@
+# 批量生成：惰性枚举变量组合，逐条渲染，不在内存中保存完整结果
+
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from math import prod
+
+from generator import VARIABLE_KEYS, RenderPlan, affecting_keys, varying_variables
+
+# 单次批量生成允许的最大组合数
+MAX_BATCH_SIZE = 1_000_000
+
+# 并行渲染配置（环境变量）：进程数、每个分片的行数、启用并行的最小行数
+BATCH_WORKERS = int(os.environ.get("SORA2_BATCH_WORKERS", str(os.cpu_count() or 1)))
+SHARD_SIZE = int(os.environ.get("SORA2_SHARD_SIZE", "20000"))
+PARALLEL_MIN_ROWS = int(os.environ.get("SORA2_PARALLEL_MIN_ROWS", "50000"))
+
+
+def estimate_batch_size(variables):
+    """预估变量笛卡尔积的组合总数（不做枚举）"""
+    if not variables:
+        return 0
+    return prod(len(values) for values in variables.values())
+
+
+def split_variables(settings, variables):
+    """区分会影响提示词的变量和无效变量，并去除每个变量中的重复值
+
+    无效变量（名称不是内容槽位或扫描维度、当前模板未使用，或在当前设置下任何取值
+    都渲染出相同文本，如已选视觉风格时的色调/氛围）只会成倍复制完全相同的提示词，
+    因此不参与组合枚举。
+
+    有效变量的不同取值不保证总能得到不同的提示词：变量只在另一变量取某些值时才有影响的
+    组合仍会重复。
+
+    Returns:
+        (有效变量, 无效变量)，均为 变量名 -> 去重后的值列表
+    """
+    used_keys = affecting_keys(settings)
+    candidates, inert = {}, {}
+    for name, values in variables.items():
+        unique_values = list(dict.fromkeys(values))
+        if name in VARIABLE_KEYS and VARIABLE_KEYS[name][0] in used_keys:
+            candidates[name] = unique_values
+        else:
+            inert[name] = unique_values
+    varying = varying_variables(settings, candidates)
+    active = {}
+    for name, values in candidates.items():
+        if name in varying:
+            active[name] = values
+        else:
+            inert[name] = values
+    return active, inert
+
+
+def iter_combinations(variables):
+    """逐个产出变量组合字典"""
+    var_names = list(variables.keys())
+    for combination in itertools.product(*variables.values()):
+        yield dict(zip(var_names, combination))
+
+
+def iter_batch(settings, variables, limit=MAX_BATCH_SIZE, inert=None):
+    """逐条产出批量提示词
+
+    Args:
+        settings: 生成时的界面控件取值快照
+        variables: 变量名 -> 值列表（只应包含有效变量）
+        limit: 最多产出的条数
+        inert: 无效变量 变量名 -> 值列表；每条提示词对应这些值的全部组合，
+            以列表形式记录在 variables 中，而不是逐一展开
+    """
+    plan = RenderPlan(settings, variables.keys())
+    combinations = itertools.islice(iter_combinations(variables), limit)
+    for idx, template_vars in enumerate(combinations):
+        prompt = plan.render(template_vars)
+        if inert:
+            template_vars.update(inert)
+        yield {
+            'id': idx + 1,
+            'variables': template_vars,
+            'prompt': prompt
+        }
+
+
+def decode_combination(index, sizes):
+    """混合进制解码：第 index 个组合中每个变量的取值下标（与 itertools.product 顺序一致）"""
+    digits = []
+    for size in reversed(sizes):
+        index, digit = divmod(index, size)
+        digits.append(digit)
+    digits.reverse()
+    return digits
+
+
+def encode_combination(digits, sizes):
+    """decode_combination 的逆运算"""
+    index = 0
+    for digit, size in zip(digits, sizes):
+        index = index * size + digit
+    return index
+
+
+class CombinationIds:
+    """全部组合批次中按变量取值筛选后的 id 序列（id = 组合下标 + 1，升序）
+
+    按下标直接计算，不枚举组合也不查询存储；支持 len、下标访问和 in。
+    """
+
+    def __init__(self, variables, fixed):
+        names = list(variables)
+        self._sizes = [len(variables[name]) for name in names]
+        self._fixed = {}
+        self._free = []
+        self._len = 1
+        for pos, name in enumerate(names):
+            if name not in fixed:
+                self._free.append(pos)
+                self._len *= self._sizes[pos]
+            elif fixed[name] in variables[name]:
+                self._fixed[pos] = variables[name].index(fixed[name])
+            else:
+                self._len = 0
+        self._free_sizes = [self._sizes[pos] for pos in self._free]
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, k):
+        if not 0 <= k < self._len:
+            raise IndexError(k)
+        digits = [0] * len(self._sizes)
+        for pos, digit in self._fixed.items():
+            digits[pos] = digit
+        for pos, digit in zip(self._free, decode_combination(k, self._free_sizes)):
+            digits[pos] = digit
+        return encode_combination(digits, self._sizes) + 1
+
+    def __contains__(self, row_id):
+        if not 0 < row_id <= prod(self._sizes) or not self._len:
+            return False
+        digits = decode_combination(row_id - 1, self._sizes)
+        return all(digits[pos] == digit for pos, digit in self._fixed.items())
+
+
+def iter_batch_range(settings, variables, start, stop, inert=None):
+    """逐条产出第 start 到 stop-1 个组合的提示词
+
+    起点按混合进制直接解码，之后逐位进位递增，不需要从第0个组合开始枚举。
+    """
+    names = list(variables)
+    values = [variables[name] for name in names]
+    sizes = [len(v) for v in values]
+    plan = RenderPlan(settings, names)
+    digits = decode_combination(start, sizes)
+    for idx in range(start, stop):
+        template_vars = {name: vals[d] for name, vals, d in zip(names, values, digits)}
+        prompt = plan.render(template_vars)
+        if inert:
+            template_vars.update(inert)
+        yield {
+            'id': idx + 1,
+            'variables': template_vars,
+            'prompt': prompt
+        }
+        # 末位加一并进位
+        for pos in range(len(digits) - 1, -1, -1):
+            digits[pos] += 1
+            if digits[pos] < sizes[pos]:
+                break
+            digits[pos] = 0
+
+
+def render_shard(settings, variables, inert, start, stop):
+    """在工作进程中渲染一个分片，并直接编码成存储记录
+
+    Returns:
+        ([(id, 变量JSON, 提示词), ...], 总字数)
+    """
+    records = []
+    total_chars = 0
+    for p in iter_batch_range(settings, variables, start, stop, inert):
+        total_chars += len(p['prompt'])
+        records.append((p['id'], json.dumps(p['variables'], ensure_ascii=False), p['prompt']))
+    return records, total_chars
+
+
+# 进程内共享的进程池，首次并行渲染时创建
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(workers=BATCH_WORKERS):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Streamlit 在多线程中运行脚本，fork 子进程可能复制到被其他线程持有的锁，因此使用 spawn
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def iter_batch_shards(settings, variables, limit=MAX_BATCH_SIZE, inert=None, workers=BATCH_WORKERS, shard_size=SHARD_SIZE):
+    """多进程并行渲染，按组合下标切分为分片，按顺序逐个产出分片结果
+
+    同时在途的分片数不超过进程数的2倍，消费方（写入存储）较慢时不会堆积结果。
+
+    Yields:
+        (记录列表, 总字数)，与 render_shard 的返回值相同
+    """
+    total = min(estimate_batch_size(variables) if variables else 1, limit)
+    executor = get_process_pool(workers)
+    pending = collections.deque()
+    try:
+        for start in range(0, total, shard_size):
+            pending.append(executor.submit(render_shard, settings, variables, inert, start, min(start + shard_size, total)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # 消费方提前结束时取消尚未开始的分片
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,284 @@
+# 批量结果的磁盘存储：每个会话的批次写入独立的 SQLite 文件，内存中只保留句柄
+
+import contextlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+STORE_DIR = os.environ.get("SORA2_STORE_DIR", os.path.join(tempfile.gettempdir(), "sora2_batches"))
+# 超过该时间未修改的存储文件视为遗留文件（进程异常退出等），创建新存储时顺带清理
+STALE_SECONDS = float(os.environ.get("SORA2_STORE_STALE_SECONDS", str(24 * 3600)))
+# 打开的存储在被访问时至少每隔该秒数更新一次文件修改时间，其他进程清理时不会当作遗留文件
+TOUCH_SECONDS = 600
+
+WRITE_CHUNK_SIZE = 5000
+GET_CHUNK_SIZE = 10000
+# 每次搜索最多扫描的记录数（约 0.1 秒），没找够时返回续查位置
+SEARCH_SCAN_ROWS = int(os.environ.get("SORA2_SEARCH_SCAN_ROWS", "50000"))
+
+_ROW_COLUMNS = "id, variables, prompt"
+
+
+class StoreClosedError(RuntimeError):
+    """存储已关闭（批次被替换或会话结束），后台任务写入或读取时抛出"""
+
+
+# 本进程中打开的存储文件路径，清理时跳过
+_open_paths = set()
+_open_paths_lock = threading.Lock()
+
+_STORE_SUFFIXES = ("-wal", "-shm", "-journal")
+
+
+def _remove_store(conn, path):
+    with _open_paths_lock:
+        _open_paths.discard(path)
+    conn.close()
+    for suffix in ("", *_STORE_SUFFIXES):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def sweep_stale_stores(directory=STORE_DIR, max_age=STALE_SECONDS):
+    """删除过期的遗留存储文件
+
+    本进程中打开的存储不会删除；-wal/-shm 等附属文件按主文件的修改时间判断，主文件已不存在时一并删除。
+    """
+    if not os.path.isdir(directory):
+        return
+    now = time.time()
+    with _open_paths_lock:
+        open_paths = set(_open_paths)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        base = next((path[:-len(suffix)] for suffix in _STORE_SUFFIXES if name.endswith(suffix)), path)
+        if base in open_paths:
+            continue
+        try:
+            mtime = os.path.getmtime(base) if os.path.exists(base) else 0
+            if now - mtime > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _to_row(record):
+    row_id, variables, prompt = record
+    return {'id': row_id, 'variables': json.loads(variables), 'prompt': prompt}
+
+
+def _variable_path(name):
+    return '$."' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class BatchStore:
+    """单个批次结果的磁盘存储
+
+    放入 session_state 的只有这个句柄；会话结束、句柄被回收或进程退出时删除文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.closed = False
+        self._touched = time.monotonic()
+        with _open_paths_lock:
+            _open_paths.add(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "id INTEGER PRIMARY KEY, variables TEXT NOT NULL, prompt TEXT NOT NULL, enhanced TEXT)"
+        )
+        self._len = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        # 筛选条件 -> 条数（BatchStoreView.__len__ 的缓存），写入时清空
+        self._counts = {}
+        # 句柄被回收（会话结束）或进程退出时关闭连接并删除文件
+        self._finalizer = weakref.finalize(self, _remove_store, self._conn, path)
+
+    @classmethod
+    def create(cls, directory=STORE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        sweep_stale_stores(directory)
+        return cls(os.path.join(directory, f"batch_{uuid.uuid4().hex}.sqlite3"))
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """持锁访问连接；关闭后抛出 StoreClosedError"""
+        with self._lock:
+            if self.closed:
+                raise StoreClosedError("批次存储已关闭")
+            now = time.monotonic()
+            if now - self._touched > TOUCH_SECONDS:
+                self._touched = now
+                try:
+                    os.utime(self.path)
+                except OSError:
+                    pass
+            yield self._conn
+
+    def close(self):
+        """关闭并删除存储文件
+
+        持锁关闭，正在写入的后台任务在当前分块结束后才会关闭连接，下一分块抛出 StoreClosedError。
+        """
+        with self._lock:
+            self.closed = True
+            self._finalizer()
+
+    def write(self, rows, chunk_size=WRITE_CHUNK_SIZE):
+        """分块写入提示词记录，返回写入总字数
+
+        每个分块单独持锁，写入过程中可以随时关闭存储。
+        """
+        total_chars = 0
+        chunk = []
+        for p in rows:
+            total_chars += len(p['prompt'])
+            chunk.append((p['id'], json.dumps(p['variables'], ensure_ascii=False), p['prompt']))
+            if len(chunk) >= chunk_size:
+                self._insert(chunk)
+                chunk = []
+        if chunk:
+            self._insert(chunk)
+        return total_chars
+
+    def write_encoded(self, shards):
+        """按顺序写入已编码的分片（见 batch.render_shard），返回写入总字数"""
+        total_chars = 0
+        for records, chars in shards:
+            self._insert(records)
+            total_chars += chars
+        return total_chars
+
+    def _insert(self, chunk):
+        with self._locked() as conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT INTO rows (id, variables, prompt) VALUES (?, ?, ?)", chunk)
+            conn.execute("COMMIT")
+            self._len += len(chunk)
+            self._counts.clear()
+
+    def __len__(self):
+        return self._len
+
+    def iter_rows(self, chunk_size=WRITE_CHUNK_SIZE):
+        """按 id 顺序逐条读出全部记录（分块查询，内存占用与批次大小无关）"""
+        last_id = 0
+        while True:
+            with self._locked() as conn:
+                records = conn.execute(
+                    f"SELECT {_ROW_COLUMNS} FROM rows WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk_size)
+                ).fetchall()
+            if not records:
+                return
+            for record in records:
+                yield _to_row(record)
+            last_id = records[-1][0]
+
+    def get_many(self, ids):
+        """按 id 取记录，保持传入顺序"""
+        ids = list(ids)
+        records = []
+        # 分块查询，避免超过 SQLite 单条语句的参数个数上限
+        with self._locked() as conn:
+            for start in range(0, len(ids), GET_CHUNK_SIZE):
+                chunk = ids[start:start + GET_CHUNK_SIZE]
+                records.extend(conn.execute(
+                    f"SELECT {_ROW_COLUMNS} FROM rows WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        by_id = {record[0]: _to_row(record) for record in records}
+        return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+    def view(self, fixed=None, ids=None):
+        """按变量取值筛选后的视图；ids 为筛选后的 id 序列（升序）时按 id 取记录"""
+        return BatchStoreView(self, fixed or {}, ids)
+
+    # ---------- AI增强结果 ----------
+
+    def set_enhanced(self, row_id, text):
+        with self._locked() as conn:
+            conn.execute("UPDATE rows SET enhanced = ? WHERE id = ?", (text, row_id))
+
+    def enhanced_rows(self):
+        """已增强的记录，prompt 为增强后的文本"""
+        with self._locked() as conn:
+            records = conn.execute(
+                "SELECT id, variables, enhanced FROM rows WHERE enhanced IS NOT NULL ORDER BY id"
+            ).fetchall()
+        return [_to_row(record) for record in records]
+
+
+class BatchStoreView:
+    """BatchStore 的筛选视图：分页与搜索都在 SQLite 内完成
+
+    传入 ids（如 batch.CombinationIds）时按 id 直接取记录，不必逐条解析变量 JSON；
+    否则按 json_extract 筛选，筛选结果的条数按条件缓存在存储上。
+    """
+
+    def __init__(self, store, fixed, ids=None):
+        self.store = store
+        self.ids = ids
+        clauses = ["json_extract(variables, ?) = ?" for _ in fixed]
+        self._where = " AND ".join(clauses) if clauses else "1"
+        self._params = [value for name, expected in fixed.items() for value in (_variable_path(name), expected)]
+
+    def _query(self, sql, params=()):
+        with self.store._locked() as conn:
+            return conn.execute(sql, [*self._params, *params]).fetchall()
+
+    def __len__(self):
+        if self.ids is not None:
+            return len(self.ids)
+        if self._where == "1":
+            return len(self.store)
+        key = tuple(self._params)
+        if key not in self.store._counts:
+            self.store._counts[key] = self._query(f"SELECT COUNT(*) FROM rows WHERE {self._where}")[0][0]
+        return self.store._counts[key]
+
+    def rows(self, start, stop):
+        if self.ids is not None:
+            return self.store.get_many(self.ids[k] for k in range(max(start, 0), min(stop, len(self.ids))))
+        records = self._query(
+            f"SELECT {_ROW_COLUMNS} FROM rows WHERE {self._where} ORDER BY id LIMIT ? OFFSET ?",
+            (max(stop - start, 0), start)
+        )
+        return [_to_row(record) for record in records]
+
+    def search(self, text, after_id=0, limit=10, scan_rows=SEARCH_SCAN_ROWS):
+        """查找 id > after_id 且提示词包含 text 的记录
+
+        找到 limit 条或扫描完 after_id 之后 scan_rows 个 id 的范围后停止（与筛选条件无关），
+        大批次中没有匹配时也不会一次扫完全部记录。
+
+        Returns:
+            (匹配的 id 列表, 续查位置)；续查位置作为下一次的 after_id，已扫描到末尾时为 None
+        """
+        # 传入 ids 时按 id 范围扫描全部记录，匹配的 id 再判断是否在筛选结果中
+        where, params = ("1", []) if self.ids is not None else (self._where, self._params)
+        upper = after_id + scan_rows
+        matches = []
+        with self.store._locked() as conn:
+            max_id = conn.execute("SELECT MAX(id) FROM rows").fetchone()[0] or 0
+            cursor = conn.execute(
+                f"SELECT id FROM rows WHERE {where} AND id > ? AND id <= ? AND instr(prompt, ?) > 0 ORDER BY id",
+                [*params, after_id, upper, text]
+            )
+            try:
+                for (row_id,) in cursor:
+                    if self.ids is None or row_id in self.ids:
+                        matches.append(row_id)
+                        if len(matches) >= limit:
+                            return matches, row_id
+            finally:
+                cursor.close()
+        return matches, upper if upper < max_id else None
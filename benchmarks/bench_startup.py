@@ -0,0 +1,71 @@
+"""冷启动导入耗时基准（python -X importtime）
+
+导入应用自身的全部模块（不含 streamlit），输出按累计耗时排序的报告，
+并检查：总耗时不超过预算；openai / httpx 未在启动时被导入。
+
+运行：python benchmarks/bench_startup.py [--budget-ms 250] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 应用启动时导入的自有模块
+# dedup 依赖 numpy，streamlit 启动时本来就会导入，不计入
+APP_MODULES = [
+    "metrics", "templates", "generator", "batch", "sampling", "batch_store",
+    "exporters", "response_cache", "history", "ai", "jobs", "tasks",
+]
+
+# 导入预算（毫秒），以及启动阶段禁止导入的重量级依赖
+# 预算中的大头是 asyncio / ssl / sqlite3 等标准库，streamlit 启动时本来也会加载；
+# openai 依赖链（httpx、pydantic 等）通常会再增加数百毫秒
+BUDGET_MS = 250
+FORBIDDEN_MODULES = ["openai", "httpx", "pydantic"]
+
+
+def measure():
+    """运行一次 -X importtime，返回 [(模块名, 自身耗时us, 累计耗时us, 层级)]"""
+    code = f"import {', '.join(APP_MODULES)}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    entries = measure()
+    top_level = [entry for entry in entries if entry[3] == 0]
+    total_ms = sum(cumulative for _, _, cumulative, _ in top_level) / 1000
+
+    print(f"{'模块':<32}{'自身(ms)':>10}{'累计(ms)':>10}")
+    for name, self_us, cumulative_us, _ in sorted(entries, key=lambda e: -e[2])[:args.top]:
+        print(f"{name:<32}{self_us / 1000:>10.2f}{cumulative_us / 1000:>10.2f}")
+    print(f"\n总导入耗时 {total_ms:.1f} ms（预算 {args.budget_ms:.0f} ms）")
+
+    imported = {name for name, _, _, _ in entries}
+    failures = [f"启动时导入了 {module}" for module in FORBIDDEN_MODULES if module in imported]
+    if total_ms > args.budget_ms:
+        failures.append(f"导入耗时 {total_ms:.1f} ms 超出预算 {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
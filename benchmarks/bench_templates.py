@@ -0,0 +1,78 @@
+"""预编译模板渲染 / 批量渲染计划 vs 旧版 str.format(28个关键字参数) 的基准测试
+
+运行：python benchmarks/bench_templates.py
+"""
+import timeit
+
+from fixtures import SETTINGS, TEMPLATE_VARS
+from templates import TEMPLATES
+from generator import RenderPlan, apply_template_vars, render_template
+
+
+def legacy_render(template_name, settings, template_vars):
+    """旧版 generate_prompt 的模板分支（逐次构建全部28个参数）"""
+    _brand = template_vars.get("品牌", settings["brand_name"])
+    _theme = template_vars.get("主题", settings["theme"])
+    _slogan = template_vars.get("广告语", settings["slogan"])
+    _location = template_vars.get("地点", settings["location"])
+    _scene = template_vars.get("场景", settings["scene_description"])
+    tone = settings["tone"]
+    camera_technique = settings["camera_technique"]
+    director_style = settings["director_style"]
+    visual_style = settings["visual_style"]
+    return TEMPLATES[template_name]["template"].format(
+        地点=_location or "{地点}",
+        主题=_theme or "{主题}",
+        品牌=_brand or "{品牌}",
+        广告语=_slogan or "{广告语}",
+        国家=settings["country"],
+        场景=_scene or "{场景}",
+        场景描述=_scene or "{场景描述}",
+        氛围=tone,
+        镜头特写=", ".join(camera_technique) if camera_technique else "{镜头特写}",
+        旁白风格=tone,
+        广告文案=_slogan or "{广告文案}",
+        主题标语=_slogan or "{主题标语}",
+        KOL="@sama",
+        道具="{道具}",
+        道具2="{道具2}",
+        语言="英语带点亲切的中文味",
+        歌词="{歌词}",
+        地标="{地标}",
+        主体="{主体}",
+        对比场景="{对比场景}",
+        细节动作="{细节动作}",
+        公益主题=_theme or "{公益主题}",
+        公益口号=_slogan or "{公益口号}",
+        动作="{动作}",
+        导演风格=director_style if director_style != "无特定风格" else "{导演风格}",
+        镜头运用=", ".join(camera_technique) if camera_technique else "{镜头运用}",
+        色调氛围=", ".join(visual_style) if visual_style else tone
+    )
+
+
+def compiled_render(template_name, settings, template_vars):
+    return render_template(template_name, apply_template_vars(settings, template_vars))
+
+
+def main(number=20000):
+    print(f"{'模板':<16}{'format (µs)':>14}{'compiled (µs)':>16}{'plan (µs)':>12}{'加速比':>8}")
+    for name in TEMPLATES:
+        settings = dict(SETTINGS, selected_template=name)
+        plan = RenderPlan(settings, TEMPLATE_VARS.keys())
+        expected = legacy_render(name, settings, TEMPLATE_VARS)
+        assert expected == compiled_render(name, settings, TEMPLATE_VARS) == plan.render(TEMPLATE_VARS), name
+        timings = [
+            min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+            for func in (
+                lambda: legacy_render(name, settings, TEMPLATE_VARS),
+                lambda: compiled_render(name, settings, TEMPLATE_VARS),
+                lambda: plan.render(TEMPLATE_VARS),
+            )
+        ]
+        legacy_us, compiled_us, plan_us = timings
+        print(f"{name:<16}{legacy_us:>14.2f}{compiled_us:>16.2f}{plan_us:>12.2f}{legacy_us / plan_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""基准测试共用的输入数据"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates import AUDIO_SUGGESTIONS, CAMERA_LANGUAGE, PHYSICS_EFFECTS, SWEEP_AXES, TIMING_RHYTHM  # noqa: E402
+
+SETTINGS = {
+    "selected_template": "Nike运动广告",
+    "country": "中国",
+    "location": "长沙",
+    "duration": 10,
+    "visual_style": ["黑白高对比", "热闹烟火气"],
+    "camera_technique": ["快速切换", "慢动作特写"],
+    "tone": "活泼开放",
+    "director_style": "张艺谋（宏伟场面）",
+    "industry_type": "不限",
+    "industry_subtype": None,
+    "camera_type": [],
+    "camera_movement": [],
+    "depth_of_field": [],
+    "camera_speed": "不限",
+    "lighting": [],
+    "particles": [],
+    "weather": "不限",
+    "physics_sim": [],
+    "music_type": "不限",
+    "sound_effects": [],
+    "rhythm": "不限",
+    "rhythm_pattern": "不限",
+    "shot_transition": "不限",
+    "brand_name": "长沙臭豆腐",
+    "theme": "臭豆腐",
+    "slogan": "Anytime，臭豆腐 Time！",
+    "scene_description": "",
+}
+
+# 自定义模式，所有精确控制参数都填满
+FULL_CUSTOM_SETTINGS = dict(
+    SETTINGS,
+    selected_template="自定义",
+    industry_type="电商营销",
+    industry_subtype="产品展示",
+    scene_description="夜市街角，霓虹灯下热气腾腾的小吃摊",
+    camera_type=CAMERA_LANGUAGE["镜头类型"][:2],
+    camera_movement=CAMERA_LANGUAGE["运镜方式"][:3],
+    depth_of_field=CAMERA_LANGUAGE["景深效果"][:1],
+    camera_speed=CAMERA_LANGUAGE["镜头速度"][0],
+    lighting=PHYSICS_EFFECTS["光影效果"][:2],
+    particles=PHYSICS_EFFECTS["粒子效果"][:2],
+    weather=PHYSICS_EFFECTS["天气氛围"][5],
+    physics_sim=PHYSICS_EFFECTS["物理模拟"][:1],
+    music_type=AUDIO_SUGGESTIONS["音乐类型"][0],
+    sound_effects=AUDIO_SUGGESTIONS["音效建议"][:2],
+    rhythm=AUDIO_SUGGESTIONS["节奏匹配"][0],
+    rhythm_pattern=TIMING_RHYTHM["节奏分段"][1],
+    shot_transition=TIMING_RHYTHM["镜头切换"][2],
+)
+
+TEMPLATE_VARS = {"地点": "武汉", "主题": "热干面"}
+
+SLOT_NAMES = ["地点", "主题", "品牌", "广告语", "场景"]
+
+
+def make_variables(total):
+    """构造组合数恰好为 total（10 的幂）的批量变量，依次填满各内容槽位"""
+    variables = {}
+    remaining = total
+    for index, name in enumerate(SLOT_NAMES):
+        if remaining == 1:
+            break
+        size = remaining if index == len(SLOT_NAMES) - 1 else min(remaining, 10)
+        variables[name] = [f"{name}{i}" for i in range(size)]
+        remaining //= size
+    return variables
+
+
+# 参数扫描：6个控制维度取全部选项，共 7*6*6*7*7*7 = 86436 个组合
+SWEEP_VARIABLES = {
+    axis: list(SWEEP_AXES[axis][1])
+    for axis in ["视觉风格", "镜头运用", "色调/氛围", "运镜方式", "光影效果", "音乐类型"]
+}
@@ -0,0 +1,197 @@
+"""提示词生成与导出热点路径的基准测试套件（无需浏览器）
+
+测量项：
+- generate/<模板>：7个预设模板及“自定义（全部精确控制参数）”的单条生成
+- preview/<改动>：单个生成实时预览的一次增量更新（场景描述约3万字）
+- batch/<组合数>：批量渲染 10 / 1k / 100k / 1M 个组合（自定义模式，全部精确控制参数）
+- sweep/<组合数>：6个控制维度的参数扫描
+- batch_store/<组合数>：批量渲染并写入磁盘存储（与页面上的批量生成流程一致）
+- export/<格式>：导出 10k 条提示词
+
+结果以 JSON 输出，并与基线比较；任一项耗时超过基线的 --tolerance 倍即返回非零退出码。
+
+运行：
+    python benchmarks/run.py                      # 与 benchmarks/baseline.json 比较
+    python benchmarks/run.py --quick              # 跳过 1M 组合
+    python benchmarks/run.py --update-baseline    # 重新生成基线
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from fixtures import FULL_CUSTOM_SETTINGS, SETTINGS, SWEEP_VARIABLES, TEMPLATE_VARS, make_variables
+from templates import TEMPLATES
+from generator import LivePreview, render_prompt
+from batch import estimate_batch_size, iter_batch
+from batch_store import BatchStore
+from exporters import EXPORT_FORMATS, export_prompts, remove_export
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+BATCH_SIZES = [10, 1_000, 100_000, 1_000_000]
+STORE_SIZES = [10, 1_000, 100_000]
+EXPORT_SIZE = 10_000
+
+
+def best_of(func, repeat):
+    """运行 repeat 次取最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_generate(number=2000):
+    results = {}
+    cases = [(name, dict(SETTINGS, selected_template=name)) for name in TEMPLATES]
+    cases.append(("自定义", FULL_CUSTOM_SETTINGS))
+    for name, settings in cases:
+        seconds = best_of(lambda: [render_prompt(settings, TEMPLATE_VARS) for _ in range(number)], repeat=5)
+        results[f"generate/{name}"] = {"seconds": seconds / number, "items": 1}
+    return results
+
+
+def bench_preview(number=2000):
+    """实时预览：交替修改一个控件，测量每次增量更新的耗时"""
+    scene = "夜市街头，小摊的灯光映在油锅上，人群熙熙攘攘，摊主熟练地翻动臭豆腐。\n" * 1000
+    base = dict(FULL_CUSTOM_SETTINGS, scene_description=scene)
+    cases = {
+        "tone": [dict(base, tone="活泼开放"), dict(base, tone="庄重正式")],
+        "lighting": [dict(base, lighting=["逆光"]), dict(base, lighting=["柔光"])],
+        "scene": [base, dict(base, scene_description=scene + "结尾定格在招牌上。")],
+    }
+    results = {}
+    for name, variants in cases.items():
+        preview = LivePreview()
+
+        def run():
+            for i in range(number):
+                preview.update(variants[i % 2])
+
+        seconds = best_of(run, repeat=5)
+        results[f"preview/{name}"] = {"seconds": seconds / number, "items": 1}
+    return results
+
+
+def _consume(rows):
+    count = 0
+    for _ in rows:
+        count += 1
+    return count
+
+
+def bench_batch(sizes):
+    results = {}
+    for size in sizes:
+        variables = make_variables(size)
+        repeat = 3 if size <= 100_000 else 1
+        seconds = best_of(lambda: _consume(iter_batch(FULL_CUSTOM_SETTINGS, variables)), repeat)
+        results[f"batch/{size}"] = {"seconds": seconds, "items": size}
+    return results
+
+
+def bench_sweep():
+    size = estimate_batch_size(SWEEP_VARIABLES)
+    seconds = best_of(lambda: _consume(iter_batch(FULL_CUSTOM_SETTINGS, SWEEP_VARIABLES)), repeat=3)
+    return {f"sweep/{size}": {"seconds": seconds, "items": size}}
+
+
+def bench_batch_store(sizes):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            variables = make_variables(size)
+
+            def run():
+                store = BatchStore.create(directory)
+                store.write(iter_batch(FULL_CUSTOM_SETTINGS, variables))
+                store.close()
+
+            seconds = best_of(run, repeat=3 if size <= 1_000 else 1)
+            results[f"batch_store/{size}"] = {"seconds": seconds, "items": size}
+    return results
+
+
+def bench_export():
+    results = {}
+    rows = list(iter_batch(FULL_CUSTOM_SETTINGS, make_variables(EXPORT_SIZE)))
+    for format_type in EXPORT_FORMATS:
+        sizes = []
+
+        def run():
+            path, _filename, _mime = export_prompts(iter(rows), format_type)
+            sizes.append(os.path.getsize(path))
+            remove_export(path)
+
+        seconds = best_of(run, repeat=3)
+        results[f"export/{format_type}"] = {"seconds": seconds, "items": EXPORT_SIZE, "bytes": sizes[-1]}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """返回超出基线 tolerance 倍的项"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference and result["seconds"] > reference["seconds"] * tolerance:
+            regressions.append((name, reference["seconds"], result["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="跳过 1M 组合")
+    parser.add_argument("--output", help="结果 JSON 写入路径（默认输出到标准输出）")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="允许相对基线变慢的倍数")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    batch_sizes = [size for size in BATCH_SIZES if not (args.quick and size >= 1_000_000)]
+    results = {}
+    results.update(bench_generate())
+    results.update(bench_preview())
+    results.update(bench_batch(batch_sizes))
+    results.update(bench_sweep())
+    results.update(bench_batch_store(STORE_SIZES))
+    results.update(bench_export())
+    for result in results.values():
+        result["per_item_us"] = result["seconds"] / result["items"] * 1e6
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+        print(f"基线已更新：{args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"未找到基线 {args.baseline}，跳过比较", file=sys.stderr)
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for name, before, after in regressions:
+        print(f"❌ 性能回退 {name}: {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
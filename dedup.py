@@ -0,0 +1,199 @@
+# 近似重复检测：字符 shingle 的 MinHash 签名（NumPy 向量化）+ LSH 分段聚类 + 多样性排序
+# 批量结果和AI增强结果里大量提示词只差一两个字，去掉后可以少付后续视频生成的费用
+
+import numpy as np
+
+# 字符 shingle 长度：中文按3个字符一组
+SHINGLE_SIZE = 3
+# 签名长度（分桶数），必须是2的幂
+NUM_BINS = 128
+# 估计的 Jaccard 相似度不低于该值视为近似重复
+DEFAULT_THRESHOLD = 0.9
+# 每次处理的提示词条数，控制中间数组的内存占用
+CHUNK_SIZE = 20_000
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+_PRIME = np.uint64(1_000_003)
+_MIX1 = np.uint64(0xFF51AFD7ED558CCD)
+_MIX2 = np.uint64(0xC4CEB9FE1A85EC53)
+_SHIFT = np.uint64(33)
+
+
+def _fmix64(h):
+    """MurmurHash3 的 64 位收尾混合，使相近输入的哈希值充分打散"""
+    h ^= h >> _SHIFT
+    h *= _MIX1
+    h ^= h >> _SHIFT
+    h *= _MIX2
+    h ^= h >> _SHIFT
+    return h
+
+
+def _shingle_hashes(texts, shingle_size):
+    """全部文本的 shingle 哈希
+
+    文本之间用 shingle_size-1 个空字符隔开后整体转成码点数组，一次性滑窗计算，
+    每个窗口只属于一条文本。
+
+    Returns:
+        (哈希 uint64 数组, 所属文本下标数组)
+    """
+    pad = "\0" * (shingle_size - 1)
+    codes = np.frombuffer((pad.join(texts) + pad).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+
+    windows = len(codes) - shingle_size + 1
+    hashes = codes[:windows].copy()
+    for offset in range(1, shingle_size):
+        hashes *= _PRIME
+        hashes += codes[offset:offset + windows]
+    hashes = _fmix64(hashes)
+
+    # 每条文本从自身起点开始的 len(text) 个窗口
+    doc_ids = np.repeat(np.arange(len(texts)), lengths)
+    positions = np.arange(len(doc_ids)) + doc_ids * (shingle_size - 1)
+    return hashes[positions], doc_ids
+
+
+def _densify(block):
+    """空分桶取右侧（循环）最近的非空分桶的值并按距离偏移，保证签名可比"""
+    empty = block == _EMPTY
+    if not empty.any():
+        return block
+    result = block.copy()
+    num_bins = block.shape[1]
+    for distance in range(1, num_bins):
+        if not empty.any():
+            break
+        shifted = np.roll(block, -distance, axis=1)
+        fill = empty & (shifted != _EMPTY)
+        result[fill] = shifted[fill] + np.uint32((distance * 0x9E3779B1) & 0xFFFFFFFF)
+        empty &= ~fill
+    return result
+
+
+def minhash_signatures(texts, num_bins=NUM_BINS, shingle_size=SHINGLE_SIZE):
+    """计算 MinHash 签名（单次哈希分桶法）
+
+    每个 shingle 只哈希一次：高位决定分桶，低位参与该桶取最小值，
+    相比 num_bins 个独立哈希函数，计算量与签名长度无关。
+
+    Returns:
+        (文本数, num_bins) 的 uint32 数组；两行相同位置取值相等的比例即 Jaccard 相似度的估计
+    """
+    bits = num_bins.bit_length() - 1
+    if num_bins != 1 << bits:
+        raise ValueError("num_bins 必须是2的幂")
+    signatures = np.empty((len(texts), num_bins), dtype=np.uint32)
+    for start in range(0, len(texts), CHUNK_SIZE):
+        chunk = texts[start:start + CHUNK_SIZE]
+        hashes, doc_ids = _shingle_hashes(chunk, shingle_size)
+        bins = (hashes >> np.uint64(64 - bits)).astype(np.intp) if bits else np.zeros(len(hashes), dtype=np.intp)
+        block = np.full((len(chunk), num_bins), _EMPTY, dtype=np.uint32)
+        np.minimum.at(block, (doc_ids, bins), (hashes & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+        signatures[start:start + len(chunk)] = _densify(block)
+    return signatures
+
+
+def similarity(signatures, index, others=None):
+    """第 index 条与 others（默认全部）的估计 Jaccard 相似度"""
+    target = signatures if others is None else signatures[others]
+    return (target == signatures[index]).mean(axis=1)
+
+
+def lsh_params(num_bins, threshold, false_negative_weight=0.7):
+    """选择分段数和每段行数
+
+    相似度为 s 的一对提示词成为候选的概率是 1-(1-s^行数)^分段数；
+    按权重最小化阈值以下的误报面积和阈值以上的漏报面积。候选对还会用完整签名复核，
+    因此漏报权重更高。
+    """
+    below = np.linspace(0, threshold, 200)
+    above = np.linspace(threshold, 1, 200)
+
+    def cost(option):
+        bands, rows = option
+        false_positive = np.mean(1 - (1 - below ** rows) ** bands) * threshold
+        false_negative = np.mean((1 - above ** rows) ** bands) * (1 - threshold)
+        return (1 - false_negative_weight) * false_positive + false_negative_weight * false_negative
+
+    options = [(bands, num_bins // bands) for bands in range(1, num_bins + 1) if num_bins % bands == 0]
+    return min(options, key=cost)
+
+
+def _connected_components(n, src, dst):
+    """无向边的连通分量，标签为分量内最小下标（向量化的挂接 + 指针跳跃）"""
+    parent = np.arange(n)
+    while len(src):
+        root_src, root_dst = parent[src], parent[dst]
+        if np.array_equal(root_src, root_dst):
+            break
+        low = np.minimum(root_src, root_dst)
+        np.minimum.at(parent, root_src, low)
+        np.minimum.at(parent, root_dst, low)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+
+def cluster_near_duplicates(signatures, threshold=DEFAULT_THRESHOLD):
+    """LSH 分段聚类
+
+    签名按段切分，同一段完全相同的提示词落入同一个桶；桶内每条与桶内第一条比较完整签名，
+    相似度达到阈值才连边，最后求连通分量。
+
+    Returns:
+        每条提示词的聚类标签（等于该类中最靠前的下标）
+    """
+    n, num_bins = signatures.shape
+    if n == 0:
+        return np.arange(0)
+    bands, rows = lsh_params(num_bins, threshold)
+    src, dst = [], []
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows]).view(np.dtype((np.void, 4 * rows))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        representative = first[inverse.ravel()]
+        candidates = np.nonzero(representative != np.arange(n))[0]
+        if not len(candidates):
+            continue
+        matched = (signatures[candidates] == signatures[representative[candidates]]).mean(axis=1) >= threshold
+        src.append(candidates[matched])
+        dst.append(representative[candidates[matched]])
+    if not src:
+        return np.arange(n)
+    return _connected_components(n, np.concatenate(src), np.concatenate(dst))
+
+
+def representatives(labels):
+    """每个聚类保留一条（最靠前的一条）的下标"""
+    return np.nonzero(labels == np.arange(len(labels)))[0]
+
+
+def rank_by_diversity(signatures, k, indices=None):
+    """按多样性贪心排序：每次选出与已选集合最不相似的一条（最远点优先）
+
+    Args:
+        signatures: MinHash 签名
+        k: 选出的条数
+        indices: 只在这些下标中选择（例如去重后的代表），默认全部
+
+    Returns:
+        选中的下标，按选出顺序
+    """
+    indices = np.arange(len(signatures)) if indices is None else np.asarray(indices)
+    if not len(indices):
+        return indices
+    candidates = signatures[indices]
+    chosen = [0]
+    distance = 1 - similarity(candidates, 0)
+    for _ in range(min(k, len(indices)) - 1):
+        best = int(np.argmax(distance))
+        if distance[best] <= 0:
+            break
+        chosen.append(best)
+        np.minimum(distance, 1 - similarity(candidates, best), out=distance)
+    return indices[chosen]
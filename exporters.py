@@ -0,0 +1,137 @@
+# 批量结果导出：逐条写入临时文件，避免在内存中拼接整个导出内容；下载时从文件读取，下载后删除，
+# 未下载的遗留文件在之后导出时按修改时间清理
+
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import metrics
+
+# 导出格式 -> (扩展名, MIME类型)
+EXPORT_FORMATS = {
+    "TXT": ("txt", "text/plain"),
+    "CSV": ("csv", "text/csv"),
+    "JSON": ("json", "application/json"),
+    "JSONL": ("jsonl", "application/x-ndjson"),
+}
+
+# 导出文件所在目录，默认系统临时目录
+EXPORT_DIR = os.environ.get("SORA2_EXPORT_DIR") or None
+# 超过该时间未访问的导出文件视为遗留文件（会话结束前未下载等），导出时顺带清理
+EXPORT_STALE_SECONDS = float(os.environ.get("SORA2_EXPORT_STALE_SECONDS", str(6 * 3600)))
+EXPORT_PREFIX = "sora2_export_"
+
+
+def _write_txt(prompts, out):
+    separator = "=" * 80 + "\n"
+    divider = "-" * 80 + "\n"
+    for p in prompts:
+        out.write(f"{separator}提示词 #{p['id']}\n变量：{p['variables']}\n{divider}{p['prompt']}\n\n")
+
+
+def _write_csv(prompts, out):
+    out.write("ID,变量,提示词\n")
+    writer = csv.writer(out, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+    for p in prompts:
+        writer.writerow([p['id'], str(p['variables']), p['prompt'].replace('\n', ' ')])
+
+
+def _write_json(prompts, out):
+    # 逐条序列化，输出与 json.dumps(list, indent=2) 一致
+    first = True
+    for p in prompts:
+        out.write("[\n  " if first else ",\n  ")
+        out.write(json.dumps(p, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+        first = False
+    out.write("[]" if first else "\n]")
+
+
+def _write_jsonl(prompts, out):
+    for p in prompts:
+        out.write(json.dumps(p, ensure_ascii=False))
+        out.write("\n")
+
+
+WRITERS = {
+    "TXT": _write_txt,
+    "CSV": _write_csv,
+    "JSON": _write_json,
+    "JSONL": _write_jsonl,
+}
+
+
+def batch_hash(batch):
+    """批次内容的哈希，用作界面组件 key 和去重结果缓存键的前缀"""
+    payload = json.dumps(
+        {'settings': batch['settings'], 'variables': batch['variables'], 'inert': batch.get('inert'), 'sampling': batch.get('sampling')},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def export_prompts(prompts, format_type):
+    """导出提示词到临时文件
+
+    Args:
+        prompts: 可迭代的提示词记录，会被逐条消费
+        format_type: TXT / CSV / JSON / JSONL
+
+    Returns:
+        (临时文件路径, 文件名, MIME类型)；文件由调用方在下载后删除（remove_export），
+        仍在使用时调用 touch_export，否则超过 EXPORT_STALE_SECONDS 后会被清理
+    """
+    extension, mime = EXPORT_FORMATS[format_type]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    sweep_stale_exports()
+    fd, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=f".{extension}", dir=EXPORT_DIR)
+    try:
+        with metrics.timer("sora2_export_seconds", format=format_type):
+            with open(fd, "w", encoding="utf-8", newline="") as out:
+                WRITERS[format_type](prompts, out)
+    except BaseException:
+        remove_export(path)
+        raise
+    metrics.observe("sora2_export_bytes", os.path.getsize(path), format=format_type)
+
+    return path, f"sora2_prompts_{timestamp}.{extension}", mime
+
+
+def remove_export(path):
+    """删除导出文件；已删除时忽略"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def touch_export(path):
+    """更新导出文件的修改时间，避免被当作遗留文件清理；文件已不存在时返回 False"""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def sweep_stale_exports(directory=EXPORT_DIR, max_age=EXPORT_STALE_SECONDS):
+    """删除过期的遗留导出文件（会话结束或被回收时尚未下载的导出）"""
+    directory = directory or tempfile.gettempdir()
+    now = time.time()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if not name.startswith(EXPORT_PREFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
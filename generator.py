@@ -0,0 +1,408 @@
+# Sora2 提示词渲染逻辑（与 Streamlit 界面解耦，便于批量生成和基准测试复用）
+
+import difflib
+import itertools
+import metrics
+from math import prod
+from operator import itemgetter
+
+from templates import COMPILED_TEMPLATES, SWEEP_AXES
+
+# 批量变量名 -> settings 中对应的内容键
+SLOT_KEYS = {
+    "品牌": "brand_name",
+    "主题": "theme",
+    "广告语": "slogan",
+    "地点": "location",
+    "场景": "scene_description",
+}
+
+# 批量变量名 -> (settings 键, 是否多选)：内容槽位 + 参数扫描维度
+VARIABLE_KEYS = {
+    **{name: (key, False) for name, key in SLOT_KEYS.items()},
+    **{name: (key, multi) for name, (key, _options, multi) in SWEEP_AXES.items()},
+}
+
+# 批量渲染时每个分段缓存的最大条目数，超过后清空重建
+SECTION_MEMO_LIMIT = 100_000
+# 按取值检查变量是否影响提示词时，单个分段最多渲染的取值组合数（约 20 毫秒）；超过时保守地视为有影响
+VALUE_CHECK_LIMIT = 2_000
+
+
+def _join(values, fallback):
+    return ", ".join(values) if values else fallback
+
+
+# 模板占位符取值规则：占位符 -> (依赖的 settings 键, 取值函数)
+# 渲染时只计算模板实际用到的占位符
+FIELD_RESOLVERS = {
+    "地点": (("location",), lambda s: s["location"] or "{地点}"),
+    "主题": (("theme",), lambda s: s["theme"] or "{主题}"),
+    "品牌": (("brand_name",), lambda s: s["brand_name"] or "{品牌}"),
+    "广告语": (("slogan",), lambda s: s["slogan"] or "{广告语}"),
+    "国家": (("country",), lambda s: s["country"]),
+    "场景": (("scene_description",), lambda s: s["scene_description"] or "{场景}"),
+    "场景描述": (("scene_description",), lambda s: s["scene_description"] or "{场景描述}"),
+    "氛围": (("tone",), lambda s: s["tone"]),
+    "镜头特写": (("camera_technique",), lambda s: _join(s["camera_technique"], "{镜头特写}")),
+    "旁白风格": (("tone",), lambda s: s["tone"]),
+    "广告文案": (("slogan",), lambda s: s["slogan"] or "{广告文案}"),
+    "主题标语": (("slogan",), lambda s: s["slogan"] or "{主题标语}"),
+    "KOL": ((), lambda s: "@sama"),
+    "道具": ((), lambda s: "{道具}"),
+    "道具2": ((), lambda s: "{道具2}"),
+    "语言": ((), lambda s: "英语带点亲切的中文味"),
+    "歌词": ((), lambda s: "{歌词}"),
+    "地标": ((), lambda s: "{地标}"),
+    "主体": ((), lambda s: "{主体}"),
+    "对比场景": ((), lambda s: "{对比场景}"),
+    "细节动作": ((), lambda s: "{细节动作}"),
+    "公益主题": (("theme",), lambda s: s["theme"] or "{公益主题}"),
+    "公益口号": (("slogan",), lambda s: s["slogan"] or "{公益口号}"),
+    "动作": ((), lambda s: "{动作}"),
+    "导演风格": (("director_style",), lambda s: s["director_style"] if s["director_style"] != "无特定风格" else "{导演风格}"),
+    "镜头运用": (("camera_technique",), lambda s: _join(s["camera_technique"], "{镜头运用}")),
+    "色调氛围": (("visual_style", "tone"), lambda s: _join(s["visual_style"], s["tone"])),
+}
+
+
+def apply_template_vars(settings, template_vars=None):
+    """用批量变量覆盖 settings 中对应的键，返回新的 settings
+
+    多选控件的扫描取值作为唯一选项。
+    """
+    if not template_vars:
+        return settings
+    merged = dict(settings)
+    for name, value in template_vars.items():
+        if name in VARIABLE_KEYS:
+            key, multi = VARIABLE_KEYS[name]
+            merged[key] = [value] if multi else value
+    return merged
+
+
+def _camera_language_lines(s):
+    """镜头语言"""
+    parts = []
+    if s["camera_type"]:
+        parts.append(f"镜头类型：{', '.join(s['camera_type'])}")
+    if s["camera_movement"]:
+        parts.append(f"运镜方式：{', '.join(s['camera_movement'])}")
+    if s["depth_of_field"]:
+        parts.append(f"景深效果：{', '.join(s['depth_of_field'])}")
+    if s["camera_speed"] and s["camera_speed"] != "不限":
+        parts.append(f"镜头速度：{s['camera_speed']}")
+    return parts
+
+
+def _physics_lines(s):
+    """物理效果"""
+    parts = []
+    if s["lighting"]:
+        parts.append(f"光影：{', '.join(s['lighting'])}")
+    if s["particles"]:
+        parts.append(f"粒子效果：{', '.join(s['particles'])}")
+    if s["weather"] and s["weather"] != "不限":
+        parts.append(f"天气：{s['weather']}")
+    if s["physics_sim"]:
+        parts.append(f"物理模拟：{', '.join(s['physics_sim'])}")
+    return parts
+
+
+def _audio_lines(s):
+    """音频建议"""
+    parts = []
+    if s["music_type"] and s["music_type"] != "不限":
+        parts.append(f"音乐：{s['music_type']}")
+    if s["sound_effects"]:
+        parts.append(f"音效：{', '.join(s['sound_effects'])}")
+    if s["rhythm"] and s["rhythm"] != "不限":
+        parts.append(f"节奏：{s['rhythm']}")
+    return parts
+
+
+def _timing_lines(s):
+    """时长节奏"""
+    parts = []
+    if s["rhythm_pattern"] and s["rhythm_pattern"] != "不限":
+        parts.append(f"节奏分段：{s['rhythm_pattern']}")
+    if s["shot_transition"] and s["shot_transition"] != "不限":
+        parts.append(f"镜头切换：{s['shot_transition']}")
+    return parts
+
+
+# 精确控制参数分组：(依赖的 settings 键, 渲染函数)，每组返回该组的行列表（可能为空）
+PRECISE_CONTROL_GROUPS = (
+    (("camera_type", "camera_movement", "depth_of_field", "camera_speed"), _camera_language_lines),
+    (("lighting", "particles", "weather", "physics_sim"), _physics_lines),
+    (("music_type", "sound_effects", "rhythm"), _audio_lines),
+    (("rhythm_pattern", "shot_transition"), _timing_lines),
+)
+
+
+def _join_precise_control(group_texts):
+    """各组文本合并为精确控制段，全部为空时返回空字符串"""
+    precise_control = "\n".join([text for text in group_texts if text])
+    return f"\n\n\n【精确控制参数】\n{precise_control}" if precise_control else ""
+
+
+def build_precise_control_text(s):
+    """构建精确控制参数的文本"""
+    parts = []
+    for _deps, render in PRECISE_CONTROL_GROUPS:
+        parts += render(s)
+    return "\n".join(parts)
+
+
+# 每个预编译模板按占位符顺序绑定 (依赖, 取值函数)
+TEMPLATE_RESOLVERS = {
+    name: tuple(FIELD_RESOLVERS[field] for field in compiled.fields)
+    for name, compiled in COMPILED_TEMPLATES.items()
+}
+
+
+def render_template(template_name, s):
+    """渲染预设模板，只计算模板用到的占位符"""
+    return COMPILED_TEMPLATES[template_name].fmt % tuple([resolve(s) for _deps, resolve in TEMPLATE_RESOLVERS[template_name]])
+
+
+PRECISE_CONTROL_KEYS = tuple(key for deps, _render in PRECISE_CONTROL_GROUPS for key in deps)
+
+
+def _precise_control_section(s):
+    return _join_precise_control([build_precise_control_text(s)])
+
+
+# 自定义布局分段：(依赖的 settings 键, 渲染函数)
+# 各段文本已包含与前一段之间的换行，按顺序直接拼接即为完整提示词
+CUSTOM_SECTIONS = (
+    (("duration", "country"), lambda s: f"{s['duration']}秒视频，{s['country']}"),
+    (("location",), lambda s: s["location"]),
+    ((), lambda s: "场景。"),
+    # 行业类型
+    (("industry_type", "industry_subtype"), lambda s: f"\n\n行业类型：{s['industry_type']} - {s['industry_subtype'] if s['industry_subtype'] else ''}" if s["industry_type"] != "不限" else ""),
+    # 视觉风格
+    (("visual_style",), lambda s: f"\n\n视觉风格：{_join(s['visual_style'], '自然写实')}"),
+    (("camera_technique",), lambda s: f"\n镜头运用：{_join(s['camera_technique'], '平稳拍摄')}"),
+    (("tone",), lambda s: f"\n色调氛围：{s['tone']}"),
+    (("director_style",), lambda s: f"\n导演风格：{s['director_style']}" if s["director_style"] != "无特定风格" else ""),
+    # 内容元素
+    ((), lambda s: "\n\n品牌："),
+    (("brand_name",), lambda s: s["brand_name"] or "待定"),
+    ((), lambda s: "\n主题："),
+    (("theme",), lambda s: s["theme"] or "待定"),
+    ((), lambda s: "\n广告语："),
+    (("slogan",), lambda s: s["slogan"] or "待定"),
+    # 场景描述
+    (("scene_description",), lambda s: f"\n\n场景描述：{s['scene_description']}" if s["scene_description"] else ""),
+    # 精确控制参数
+    (PRECISE_CONTROL_KEYS, _precise_control_section),
+)
+
+
+def render_custom(s):
+    """按自定义布局拼接提示词"""
+    return "".join([render(s) for _deps, render in CUSTOM_SECTIONS])
+
+
+def _layout_sections(settings):
+    if settings["selected_template"] != "自定义":
+        return TEMPLATE_RESOLVERS[settings["selected_template"]]
+    return CUSTOM_SECTIONS
+
+
+def affecting_keys(settings):
+    """当前模板（或自定义布局）实际依赖的 settings 键"""
+    return {key for deps, _render in _layout_sections(settings) for key in deps}
+
+
+def varying_variables(settings, variables, limit=VALUE_CHECK_LIMIT):
+    """按取值判断哪些批量变量会改变提示词
+
+    只看依赖键不够：例如「色调氛围」只在未选视觉风格时才用到 tone。
+    对每个依赖变量的分段，渲染这些变量取值的全部组合；某个变量在其他变量取值相同时
+    只要有两个取值渲染出不同文本，就视为有影响。
+
+    Args:
+        variables: 变量名 -> 去重后的值列表
+
+    Returns:
+        会改变提示词的变量名集合
+    """
+    var_keys = {name: VARIABLE_KEYS[name] for name in variables if name in VARIABLE_KEYS}
+    varying = set()
+    for deps, render in _layout_sections(settings):
+        names = [name for name, (key, _multi) in var_keys.items() if key in deps]
+        if not names or varying.issuperset(names):
+            continue
+        if prod(len(variables[name]) for name in names) > limit:
+            varying.update(names)
+            continue
+        texts = {
+            values: render(apply_template_vars(settings, dict(zip(names, values))))
+            for values in itertools.product(*(variables[name] for name in names))
+        }
+        for i, name in enumerate(names):
+            if name in varying:
+                continue
+            # 其他变量取值相同的各组内，只要文本不止一种，该变量就有影响
+            seen = {}
+            for values, text in texts.items():
+                others = values[:i] + values[i + 1:]
+                if seen.setdefault(others, text) != text:
+                    varying.add(name)
+                    break
+    return varying
+
+
+class RenderPlan:
+    """批量渲染计划
+
+    批次内不随变量变化的占位符/分段只渲染一次并烘焙进格式串；
+    变化的分段按其依赖的变量取值缓存，每种取值组合只渲染一次，
+    每行只需查表后一次性拼接。
+    """
+
+    def __init__(self, settings, var_names):
+        # 变量名 -> (settings 键, 是否多选)，只保留会影响提示词的变量
+        self.var_keys = {name: VARIABLE_KEYS[name] for name in var_names if name in VARIABLE_KEYS}
+
+        if settings["selected_template"] != "自定义":
+            compiled = COMPILED_TEMPLATES[settings["selected_template"]]
+            sections = []
+            for literal, resolver in zip(compiled.literals, TEMPLATE_RESOLVERS[settings["selected_template"]]):
+                sections.append(((), lambda s, text=literal: text))
+                sections.append(resolver)
+            sections.append(((), lambda s, text=compiled.literals[-1]: text))
+        else:
+            sections = CUSTOM_SECTIONS
+
+        # 不变部分直接渲染并与相邻文本合并，变化部分以 %s 占位
+        fmt_parts = []
+        resolvers = []
+        needed_keys = set()
+        for deps, render in sections:
+            names = tuple(name for name, (key, _multi) in self.var_keys.items() if key in deps)
+            if names:
+                fmt_parts.append("%s")
+                # (该分段依赖的变量名, 取缓存键的函数, 渲染函数, 取值 -> 分段文本 缓存)
+                resolvers.append((names, itemgetter(*names), render, {}))
+                needed_keys.update(deps)
+            else:
+                fmt_parts.append(render(settings).replace("%", "%%"))
+        self.fmt = "".join(fmt_parts)
+        self.resolvers = tuple(resolvers)
+        # 缓存未命中时只复制变化部分需要的 settings 键
+        self.base = {key: settings[key] for key in needed_keys}
+
+    def render(self, template_vars):
+        """渲染一行：变化的分段按变量取值查缓存，未命中才渲染"""
+        if not self.resolvers:
+            return self.fmt % ()
+        parts = []
+        s = None
+        for names, key_of, render, memo in self.resolvers:
+            try:
+                memo_key = key_of(template_vars)
+            except KeyError:
+                memo_key = tuple([template_vars.get(name) for name in names])
+            text = memo.get(memo_key)
+            if text is None:
+                if s is None:
+                    s = self.base.copy()
+                    for name, (key, multi) in self.var_keys.items():
+                        if name in template_vars:
+                            s[key] = [template_vars[name]] if multi else template_vars[name]
+                text = render(s)
+                if len(memo) >= SECTION_MEMO_LIMIT:
+                    memo.clear()
+                memo[memo_key] = text
+            parts.append(text)
+        return self.fmt % tuple(parts)
+
+
+@metrics.timed("sora2_render_seconds")
+def render_prompt(settings, template_vars=None):
+    """生成提示词（不含AI增强）
+
+    Args:
+        settings: 界面控件取值字典
+        template_vars: 模板变量字典（用于批量生成）
+    """
+    s = apply_template_vars(settings, template_vars)
+    if s["selected_template"] != "自定义":
+        return render_template(s["selected_template"], s)
+    return render_custom(s)
+
+
+_UNSET = object()
+
+
+class LivePreview:
+    """单个生成的实时预览
+
+    逐段缓存渲染结果：自定义布局的每一段（精确控制参数再按组拆开）、预设模板的每个占位符。
+    每次更新只比较各段依赖的控件取值，只重新渲染取值发生变化的分段，其余直接复用。
+    """
+
+    def __init__(self):
+        self.template = None
+        self.prompt = ""
+        # 最近一次有变化的更新中，各变化分段的 (旧文本, 新文本)
+        self.changes = []
+        self.rendered = 0
+
+    def _bind(self, template):
+        if template != "自定义":
+            sections = TEMPLATE_RESOLVERS[template]
+            fmt = COMPILED_TEMPLATES[template].fmt
+            self._combine = lambda texts: fmt % tuple(texts)
+        else:
+            # 精确控制参数按组缓存，每组渲染为该组各行拼接的文本
+            groups = tuple((deps, lambda s, render=render: "\n".join(render(s))) for deps, render in PRECISE_CONTROL_GROUPS)
+            sections = CUSTOM_SECTIONS[:-1] + groups
+            split = len(CUSTOM_SECTIONS) - 1
+            self._combine = lambda texts: "".join(texts[:split]) + _join_precise_control(texts[split:])
+        self.template = template
+        self._sections = [(itemgetter(*deps) if deps else None, render) for deps, render in sections]
+        self._values = [_UNSET] * len(sections)
+        self._texts = [""] * len(sections)
+
+    def update(self, settings):
+        """按当前控件取值更新预览
+
+        Returns:
+            (提示词, 本次重新渲染的分段数)
+        """
+        template = settings["selected_template"]
+        switched = template != self.template
+        if switched:
+            self._bind(template)
+        changes = []
+        rendered = 0
+        for i, (get_value, render) in enumerate(self._sections):
+            value = get_value(settings) if get_value else None
+            if value == self._values[i]:
+                continue
+            text = render(settings)
+            rendered += 1
+            self._values[i] = value
+            if text != self._texts[i]:
+                changes.append((self._texts[i], text))
+                self._texts[i] = text
+        self.rendered = rendered
+        if changes or switched:
+            prompt = self._combine(self._texts)
+            # 切换模板时整体比较；首次渲染没有可比较的旧版本
+            self.changes = ([(self.prompt, prompt)] if self.prompt else []) if switched else changes
+            self.prompt = prompt
+        return self.prompt, rendered
+
+    def diff(self):
+        """最近一次变化的逐行差异（- 旧行 / + 新行）"""
+        lines = []
+        for old, new in self.changes:
+            for line in difflib.unified_diff(old.splitlines(), new.splitlines(), lineterm="", n=0):
+                if not line.startswith(("---", "+++", "@@")):
+                    lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,207 @@
+# 提示词历史：生成和AI增强的提示词连同参数持久化到本地 SQLite，按字符二元组倒排索引全文搜索
+# 中文没有空格分词，按相邻两个字符建索引，任意长度不小于2的子串都能通过索引定位
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+HISTORY_PATH = os.environ.get("SORA2_HISTORY_PATH", os.path.join(".cache", "sora2_history.sqlite3"))
+
+# 单字查询时倒排记录超过该数量改为按时间倒序直接扫描原文
+SCAN_THRESHOLD = 2_000
+
+# 文本末尾补一个结束符，使最后一个字符也是某个二元组的首字符，单字查询可按前缀范围查找
+_END = "\x00"
+
+
+def bigrams(text):
+    """文本中出现的全部字符二元组（去重，跨越空白的不计）"""
+    padded = text + _END
+    return {
+        padded[i:i + 2] for i in range(len(text))
+        if not padded[i].isspace() and not padded[i + 1].isspace()
+    }
+
+
+def _query_terms(query):
+    return list(dict.fromkeys(query.split()))
+
+
+def _to_record(row):
+    record_id, created_at, kind, template, params, prompt = row
+    return {
+        'id': record_id,
+        'created_at': created_at,
+        'kind': kind,
+        'template': template,
+        'params': json.loads(params) if params else None,
+        'prompt': prompt,
+    }
+
+
+class PromptHistory:
+    """提示词历史库
+
+    grams 表是倒排索引：(二元组, 提示词id) 为主键的聚簇 B 树，按二元组取出的倒排列表天然按 id 有序；
+    gram_df 记录每个二元组出现在多少条提示词中，搜索时从最少的倒排列表开始求交。
+    相同类型的相同提示词只保存一次，再次生成时更新时间和参数。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS prompts ("
+            "id INTEGER PRIMARY KEY, digest TEXT NOT NULL UNIQUE, created_at REAL NOT NULL, "
+            "kind TEXT NOT NULL, template TEXT, params TEXT, prompt TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS grams ("
+            "gram TEXT NOT NULL, prompt_id INTEGER NOT NULL, PRIMARY KEY (gram, prompt_id)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS gram_df (gram TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS prompts_created_at ON prompts(created_at);"
+        )
+
+    def add(self, prompt, kind, template=None, params=None):
+        """保存一条提示词，返回其 id"""
+        return self.add_many([(prompt, kind, template, params)])[0]
+
+    def add_many(self, records):
+        """批量保存 (提示词, 类型, 模板, 参数)，在一个事务中完成，返回 id 列表
+
+        倒排记录按二元组排序后一次写入，文档频率按批次汇总后更新，批量保存时写入量远小于逐条保存。
+        """
+        ids = []
+        postings = []
+        df = Counter()
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for prompt, kind, template, params in records:
+                    digest = hashlib.sha256(f"{kind}\n{prompt}".encode("utf-8")).hexdigest()
+                    params_json = json.dumps(params, ensure_ascii=False, default=str) if params is not None else None
+                    row = self._conn.execute("SELECT id FROM prompts WHERE digest = ?", (digest,)).fetchone()
+                    if row is not None:
+                        self._conn.execute(
+                            "UPDATE prompts SET created_at = ?, template = ?, params = ? WHERE id = ?",
+                            (now, template, params_json, row[0])
+                        )
+                        ids.append(row[0])
+                        continue
+                    prompt_id = self._conn.execute(
+                        "INSERT INTO prompts (digest, created_at, kind, template, params, prompt) VALUES (?, ?, ?, ?, ?, ?)",
+                        (digest, now, kind, template, params_json, prompt)
+                    ).lastrowid
+                    ids.append(prompt_id)
+                    grams = bigrams(prompt)
+                    df.update(grams)
+                    postings.extend((gram, prompt_id) for gram in grams)
+                postings.sort()
+                self._conn.executemany("INSERT INTO grams (gram, prompt_id) VALUES (?, ?)", postings)
+                self._conn.executemany(
+                    "INSERT INTO gram_df (gram, df) VALUES (?, ?) ON CONFLICT(gram) DO UPDATE SET df = df + excluded.df",
+                    sorted(df.items())
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+    def recent(self, limit=20, kind=None):
+        """最近保存的提示词"""
+        sql = "SELECT id, created_at, kind, template, params, prompt FROM prompts"
+        params = []
+        if kind:
+            sql += " WHERE kind = ?"
+            params.append(kind)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            return [_to_record(row) for row in self._conn.execute(sql, [*params, limit])]
+
+    def search(self, query, limit=20, kind=None):
+        """搜索包含查询中全部词（按空白分隔）的提示词，新的在前
+
+        从文档频率最低的二元组倒排列表出发，其余二元组逐条按主键确认，
+        最后用原文校验子串，避免二元组都出现但不相邻的误匹配。
+        """
+        terms = _query_terms(query)
+        if not terms:
+            return self.recent(limit, kind)
+
+        grams = set()
+        prefixes = []
+        for term in terms:
+            if len(term) == 1:
+                prefixes.append(term)
+            else:
+                grams.update(bigrams(term) - {term[-1] + _END})
+
+        with self._lock:
+            if grams:
+                placeholders = ",".join("?" * len(grams))
+                df = dict(self._conn.execute(f"SELECT gram, df FROM gram_df WHERE gram IN ({placeholders})", list(grams)))
+                if len(df) < len(grams):
+                    # 有二元组从未出现过
+                    return []
+                driver, *others = sorted(grams, key=df.__getitem__)
+                source = "SELECT prompt_id FROM grams WHERE gram = ?"
+                params = [driver]
+            else:
+                # 只有单字查询：以该字开头的二元组即包含该字的全部提示词
+                driver = prefixes[0]
+                others = []
+                bounds = [driver, driver + "\U0010ffff"]
+                total = self._conn.execute(
+                    "SELECT SUM(df) FROM gram_df WHERE gram >= ? AND gram < ?", bounds
+                ).fetchone()[0]
+                if not total:
+                    return []
+                if total > SCAN_THRESHOLD:
+                    # 常见字：从最新的提示词倒序直接扫描，很快就能凑够 limit 条
+                    source = "SELECT id AS prompt_id FROM prompts"
+                    params = []
+                else:
+                    source = "SELECT DISTINCT prompt_id FROM grams WHERE gram >= ? AND gram < ?"
+                    params = bounds
+
+            conditions = ["g.prompt_id = p.id"]
+            for gram in others:
+                conditions.append("EXISTS (SELECT 1 FROM grams WHERE gram = ? AND prompt_id = g.prompt_id)")
+                params.append(gram)
+            for term in terms:
+                conditions.append("instr(p.prompt, ?) > 0")
+                params.append(term)
+            if kind:
+                conditions.append("p.kind = ?")
+                params.append(kind)
+            sql = (
+                f"SELECT p.id, p.created_at, p.kind, p.template, p.params, p.prompt "
+                f"FROM ({source}) g JOIN prompts p ON {' AND '.join(conditions)} "
+                f"ORDER BY g.prompt_id DESC LIMIT ?"
+            )
+            return [_to_record(row) for row in self._conn.execute(sql, [*params, limit])]
+
+
+_history = None
+
+
+def get_history():
+    """进程内共享的历史库，首次使用时创建"""
+    global _history
+    if _history is None:
+        _history = PromptHistory(HISTORY_PATH)
+    return _history
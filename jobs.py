@@ -0,0 +1,272 @@
+# AI批量增强任务队列：任务和每条提示词的状态持久化到本地 SQLite，在后台线程中执行
+# 每条结果完成即写入（检查点），刷新页面、会话超时或服务重启后可以查看已完成的部分并继续执行
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from ai import enhance_batch
+
+JOBS_PATH = os.environ.get("SORA2_JOBS_PATH", os.path.join(".cache", "sora2_jobs.sqlite3"))
+
+# 任务状态
+PENDING = "pending"          # 已提交，尚未开始
+RUNNING = "running"          # 后台线程执行中
+DONE = "done"                # 全部完成
+PARTIAL = "partial"          # 执行结束，但有条目失败
+INTERRUPTED = "interrupted"  # 执行被中断（服务重启、整批出错），可继续
+
+STATUS_LABELS = {
+    PENDING: "等待中",
+    RUNNING: "执行中",
+    DONE: "已完成",
+    PARTIAL: "部分失败",
+    INTERRUPTED: "已中断",
+}
+
+# 每条提示词的状态
+ITEM_PENDING = "pending"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+
+
+def _to_result(row):
+    item_id, variables, result = row
+    return {'id': item_id, 'variables': json.loads(variables), 'prompt': result}
+
+
+class JobQueue:
+    """增强任务库
+
+    jobs 表保存任务参数和状态（不保存 API Key）；items 表以 (任务id, 条目id) 为主键保存每条提示词的
+    原文、状态、结果和尝试次数。已完成的条目不会再次发送，重复提交同一条目也不会重复写入。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, label TEXT, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS items ("
+            "job_id TEXT NOT NULL, item_id INTEGER NOT NULL, variables TEXT NOT NULL, prompt TEXT NOT NULL, "
+            "state TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (job_id, item_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs(updated_at);"
+        )
+        # 上次进程退出时仍在执行的任务已没有线程在跑
+        self._conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (INTERRUPTED, RUNNING))
+
+    def create(self, items, params, label=None):
+        """提交任务
+
+        Args:
+            items: 可迭代的 (id, 变量, 提示词)
+            params: enhance_batch 的参数（并发数、限流、打包条数等）
+            label: 任务说明
+
+        Returns:
+            任务 id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, label, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, label, json.dumps(params), PENDING, now, now)
+            )
+        self.add_items(job_id, items)
+        return job_id
+
+    def add_items(self, job_id, items):
+        """追加条目；已存在的条目保持原状态"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO items (job_id, item_id, variables, prompt, state) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (job_id, item_id, json.dumps(variables, ensure_ascii=False), prompt, ITEM_PENDING)
+                        for item_id, variables, prompt in items
+                    ]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_params(self, job_id, params):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET params = ? WHERE id = ?", (json.dumps(params), job_id))
+
+    def set_status(self, job_id, status, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        """任务信息，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, label, params, status, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'label': row[1],
+            'params': json.loads(row[2]),
+            'status': row[3],
+            'error': row[4],
+            'created_at': row[5],
+            'updated_at': row[6],
+        }
+
+    def recent(self, limit=10):
+        """最近更新的任务 id"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,))]
+
+    def unfinished_items(self, job_id, include_failed=True):
+        """尚未完成的 (id, 提示词)；include_failed=False 时只返回从未执行过的条目"""
+        states = (ITEM_PENDING, ITEM_FAILED) if include_failed else (ITEM_PENDING,)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT item_id, prompt FROM items WHERE job_id = ? AND state IN ({','.join('?' * len(states))}) ORDER BY item_id",
+                (job_id, *states)
+            ).fetchall()
+
+    def record(self, job_id, item_id, result=None, error=None):
+        """写入一条结果（检查点）；已完成的条目不会被覆盖，重试是幂等的"""
+        with self._lock:
+            if error is None:
+                self._conn.execute(
+                    "UPDATE items SET state = ?, result = ?, error = NULL, attempts = attempts + 1 "
+                    "WHERE job_id = ? AND item_id = ? AND state != ?",
+                    (ITEM_DONE, result, job_id, item_id, ITEM_DONE)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE items SET state = ?, error = ?, attempts = attempts + 1 "
+                    "WHERE job_id = ? AND item_id = ? AND state != ?",
+                    (ITEM_FAILED, f"{type(error).__name__}: {error}", job_id, item_id, ITEM_DONE)
+                )
+            self._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def progress(self, job_id):
+        """任务进度：status、total、done、failed、pending"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall())
+        return {
+            'status': job['status'],
+            'error': job['error'],
+            'total': sum(counts.values()),
+            'done': counts.get(ITEM_DONE, 0),
+            'failed': counts.get(ITEM_FAILED, 0),
+            'pending': counts.get(ITEM_PENDING, 0),
+            'updated_at': job['updated_at'],
+        }
+
+    def results(self, job_id, after_id=0, offset=0, limit=None):
+        """已完成的结果（可在执行中获取部分结果），prompt 为增强后的文本
+
+        Args:
+            after_id: 只返回 id 大于该值的结果
+            offset, limit: 分页；limit 为 None 表示不限条数
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_id, variables, result FROM items WHERE job_id = ? AND item_id > ? AND state = ? "
+                "ORDER BY item_id LIMIT ? OFFSET ?",
+                (job_id, after_id, ITEM_DONE, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [_to_result(row) for row in rows]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+# 任务 id -> 执行线程
+_runners = {}
+
+
+def get_job_queue():
+    """进程内共享的任务库，首次使用时创建"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(JOBS_PATH)
+        return _queue
+
+
+def _run_job(queue, job_id, api_key, on_result):
+    job = queue.get(job_id)
+
+    def checkpoint(item_id, text, error):
+        queue.record(job_id, item_id, text, error)
+        if on_result and error is None:
+            try:
+                on_result(item_id, text)
+            except Exception:
+                # 回调只用于同步到会话内的展示，结果已写入任务库
+                pass
+
+    try:
+        items = queue.unfinished_items(job_id)
+        while True:
+            if items:
+                enhance_batch(api_key, items, on_result=checkpoint, **job['params'])
+            # 执行期间追加的条目；在锁内确认没有新条目并写入最终状态，
+            # 之后追加条目的 start_job 看到任务已不在执行中，会启动新的执行线程
+            with _queue_lock:
+                items = queue.unfinished_items(job_id, include_failed=False)
+                if not items:
+                    progress = queue.progress(job_id)
+                    queue.set_status(job_id, PARTIAL if progress['failed'] else DONE)
+                    return
+    except Exception as e:
+        with _queue_lock:
+            queue.set_status(job_id, INTERRUPTED, error=f"{type(e).__name__}: {e}")
+
+
+def start_job(job_id, api_key, on_result=None):
+    """在后台线程中执行（或继续执行）任务的未完成条目；任务已在执行时不重复启动
+
+    API Key 只在内存中传给执行线程，服务重启后需要重新提供才能继续。
+
+    Args:
+        on_result: 每条成功时回调 on_result(id, 增强结果)，在执行线程中调用
+
+    Returns:
+        是否启动了新的执行线程
+    """
+    queue = get_job_queue()
+    with _queue_lock:
+        runner = _runners.get(job_id)
+        # 执行线程写入最终状态后即不再处理条目，此时线程可能尚未退出
+        if runner is not None and runner.is_alive() and queue.get(job_id)['status'] == RUNNING:
+            return False
+        queue.set_status(job_id, RUNNING)
+        runner = threading.Thread(
+            target=_run_job, args=(queue, job_id, api_key, on_result),
+            name=f"sora2-enhance-{job_id[:8]}", daemon=True
+        )
+        _runners[job_id] = runner
+        runner.start()
+    return True
@@ -0,0 +1,214 @@
+# 运行指标：计时、计数，导出为 Prometheus 文本格式（文件 / HTTP 端点），可选结构化日志
+# 默认关闭；关闭时 timer() 返回空操作对象、timed() 直接返回原函数，热点路径几乎没有额外开销
+#
+# 环境变量：
+#   SORA2_METRICS=1            开启指标
+#   SORA2_METRICS_FILE=路径     每次页面运行结束后写出指标文件（可配合 node_exporter textfile collector）
+#   SORA2_METRICS_PORT=端口     在该端口提供 /metrics HTTP 端点
+#   SORA2_METRICS_LOG=路径      每次计时/计数以 JSON 行写入该日志文件
+
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+ENABLED = os.environ.get("SORA2_METRICS", "0") == "1"
+METRICS_FILE = os.environ.get("SORA2_METRICS_FILE")
+METRICS_PORT = int(os.environ["SORA2_METRICS_PORT"]) if os.environ.get("SORA2_METRICS_PORT") else None
+METRICS_LOG = os.environ.get("SORA2_METRICS_LOG")
+
+TIME_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNT_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+BYTES_BUCKETS = (1_024, 16_384, 131_072, 1_048_576, 8_388_608, 67_108_864, 536_870_912)
+
+# 指标名 -> (类型, 说明, 直方图分桶)
+METRICS = {
+    "sora2_rerun_seconds": ("histogram", "整页脚本运行耗时", TIME_BUCKETS),
+    "sora2_render_seconds": ("histogram", "单条提示词渲染耗时", TIME_BUCKETS),
+    "sora2_batch_seconds": ("histogram", "批量生成（渲染并写入存储）耗时", TIME_BUCKETS),
+    "sora2_batch_rows": ("histogram", "批量生成的提示词条数", COUNT_BUCKETS),
+    "sora2_export_seconds": ("histogram", "导出序列化耗时", TIME_BUCKETS),
+    "sora2_export_bytes": ("histogram", "导出内容大小", BYTES_BUCKETS),
+    "sora2_openai_seconds": ("histogram", "OpenAI 请求耗时（流式请求到最后一段为止）", TIME_BUCKETS),
+    "sora2_openai_requests_total": ("counter", "OpenAI 请求次数", None),
+    "sora2_openai_retries_total": ("counter", "OpenAI 请求重试次数", None),
+    "sora2_openai_errors_total": ("counter", "OpenAI 请求失败次数", None),
+    "sora2_openai_tokens_total": ("counter", "OpenAI token 用量（流式请求为本地估算）", None),
+    "sora2_openai_cache_hits_total": ("counter", "响应缓存命中次数", None),
+    "sora2_openai_coalesced_total": ("counter", "合并到进行中的相同请求、未单独请求上游的调用次数", None),
+    "sora2_openai_packed_items_total": ("counter", "打包增强的条目数（result=packed 解析成功 / fallback 改为逐条请求）", None),
+}
+
+_lock = threading.Lock()
+# (指标名, 标签元组) -> [各分桶计数..., 总和, 次数]（直方图）或 数值（计数器）
+_values = {}
+
+_logger = logging.getLogger("sora2.metrics")
+if ENABLED and METRICS_LOG:
+    _handler = logging.FileHandler(METRICS_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+
+def _log(name, value, labels):
+    if METRICS_LOG:
+        _logger.info(json.dumps({"ts": time.time(), "metric": name, "value": value, **labels}, ensure_ascii=False))
+
+
+def observe(name, value, **labels):
+    """记录一次直方图观测值"""
+    if not ENABLED:
+        return
+    buckets = METRICS[name][2]
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        entry = _values.get(key)
+        if entry is None:
+            entry = _values[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+    _log(name, value, labels)
+
+
+def inc(name, value=1, **labels):
+    """计数器加 value"""
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+    _log(name, value, labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def timer(name, **labels):
+    """计时上下文：with metrics.timer("sora2_render_seconds"): ..."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name, **labels):
+    """计时装饰器；关闭指标时原样返回函数"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render():
+    """Prometheus 文本格式的全部指标"""
+    with _lock:
+        snapshot = {key: (list(value) if isinstance(value, list) else value) for key, value in _values.items()}
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in snapshot.items() if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            # 分桶计数在 observe 中已按“小于等于上界”累计
+            for bound, count in zip(buckets, value):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """把当前指标原子地写入 SORA2_METRICS_FILE"""
+    if not (ENABLED and METRICS_FILE):
+        return
+    directory = os.path.dirname(METRICS_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # 每次写入独立的临时文件：多个会话线程同时结束时各自替换，互不影响
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(METRICS_FILE) + ".", suffix=".tmp", dir=directory or None)
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(render())
+        os.replace(tmp_path, METRICS_FILE)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _start_http_server(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="sora2-metrics", daemon=True).start()
+    return server
+
+
+# 模块只在进程内导入一次，HTTP 端点随之只启动一次
+_server = _start_http_server(METRICS_PORT) if ENABLED and METRICS_PORT else None
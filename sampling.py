@@ -0,0 +1,153 @@
+# 组合空间抽样：直接选取组合下标，不枚举笛卡尔积，耗时只与样本量有关
+
+import random
+from math import prod
+
+from batch import decode_combination, encode_combination
+from generator import RenderPlan
+
+
+def sample_uniform(sizes, k, rng):
+    """均匀随机抽取 k 个不重复的组合下标"""
+    total = prod(sizes)
+    return sorted(rng.sample(range(total), min(k, total)))
+
+
+def sample_stratified(sizes, k, rng):
+    """分层抽样：每个变量的每个取值都至少出现一次
+
+    每个变量按打乱后的取值顺序循环排列，第 i 个样本取各变量排列中的第 i 位；
+    k 小于最大取值数时自动增大到该值，以保证覆盖。
+    """
+    total = prod(sizes)
+    k = min(max(k, max(sizes, default=1)), total)
+    columns = []
+    for size in sizes:
+        column = []
+        while len(column) < k:
+            block = list(range(size))
+            rng.shuffle(block)
+            column.extend(block)
+        columns.append(column)
+    chosen = {encode_combination([column[i] for column in columns], sizes) for i in range(k)}
+    # 不同行可能撞到同一组合，用均匀随机补足
+    while len(chosen) < k:
+        chosen.add(rng.randrange(total))
+    return sorted(chosen)
+
+
+def sample_pairwise(sizes, rng):
+    """两两组合覆盖（IPOG 算法构造覆盖数组）
+
+    任意两个变量的任意一对取值都至少在一个样本中同时出现；
+    样本量由算法决定，接近取值最多的两个变量的取值数之积，通常远小于全部组合数。
+    """
+    n = len(sizes)
+    if n < 2:
+        return list(range(prod(sizes)))
+
+    # 按取值数从多到少依次加入变量，前两个变量直接取全部组合
+    order = sorted(range(n), key=lambda i: -sizes[i])
+    first, second = order[0], order[1]
+    rows = []
+    for x in range(sizes[first]):
+        for y in range(sizes[second]):
+            row = [None] * n
+            row[first], row[second] = x, y
+            rows.append(row)
+
+    placed = [first, second]
+    for i in order[2:]:
+        # 新变量与已加入变量之间尚未覆盖的取值对：(已加入变量, 其取值, 新变量取值)
+        uncovered = {(j, vj, v) for j in placed for vj in range(sizes[j]) for v in range(sizes[i])}
+        values = list(range(sizes[i]))
+        rng.shuffle(values)
+
+        # 横向扩展：已有的每一行选择新覆盖最多的取值
+        for row in rows:
+            known = [j for j in placed if row[j] is not None]
+            best_value, best_count = values[0], -1
+            for v in values:
+                count = sum(1 for j in known if (j, row[j], v) in uncovered)
+                if count > best_count:
+                    best_value, best_count = v, count
+                    if count == len(known):
+                        break
+            row[i] = best_value
+            for j in known:
+                uncovered.discard((j, row[j], best_value))
+
+        # 纵向扩展：剩余取值对优先填入本轮新增行的空位，否则再新增一行
+        added = []
+        for j, vj, v in sorted(uncovered):
+            for row in added:
+                if row[i] == v and row[j] is None:
+                    row[j] = vj
+                    break
+            else:
+                row = [None] * n
+                row[i], row[j] = v, vj
+                added.append(row)
+        rows.extend(added)
+        placed.append(i)
+
+    # 未约束的位置随机取值
+    chosen = set()
+    for row in rows:
+        chosen.add(encode_combination([rng.randrange(size) if d is None else d for d, size in zip(row, sizes)], sizes))
+    return sorted(chosen)
+
+
+# 界面选项 -> 抽样函数；None 表示生成全部组合
+SAMPLING_STRATEGIES = {
+    "全部组合": None,
+    "均匀随机": sample_uniform,
+    "分层（覆盖每个取值）": sample_stratified,
+    "两两组合覆盖": lambda sizes, k, rng: sample_pairwise(sizes, rng),
+}
+
+
+# 需要指定样本量的策略
+SIZED_STRATEGIES = ("均匀随机", "分层（覆盖每个取值）")
+
+
+def estimate_sample_size(strategy, variables, k):
+    """预估样本量（两两组合覆盖为下限：取值最多的两个变量的取值数之积）"""
+    sizes = sorted((len(values) for values in variables.values()), reverse=True)
+    total = prod(sizes)
+    if strategy == "均匀随机":
+        return min(k, total)
+    if strategy == "分层（覆盖每个取值）":
+        return min(max(k, sizes[0] if sizes else 1), total)
+    return total if len(sizes) < 2 else sizes[0] * sizes[1]
+
+
+def sample_indices(strategy, variables, k, seed=None):
+    """按策略抽取组合下标（升序）
+
+    Args:
+        strategy: SAMPLING_STRATEGIES 中的选项
+        variables: 变量名 -> 值列表
+        k: 样本量（两两组合覆盖忽略该参数）
+        seed: 随机种子，相同种子得到相同样本
+    """
+    sizes = [len(values) for values in variables.values()]
+    return SAMPLING_STRATEGIES[strategy](sizes, k, random.Random(seed))
+
+
+def iter_sample(settings, variables, indices, inert=None):
+    """按组合下标逐条渲染样本，id 按样本顺序从1编号"""
+    names = list(variables)
+    values = [variables[name] for name in names]
+    sizes = [len(v) for v in values]
+    plan = RenderPlan(settings, names)
+    for idx, index in enumerate(indices):
+        template_vars = {name: vals[d] for name, vals, d in zip(names, values, decode_combination(index, sizes))}
+        prompt = plan.render(template_vars)
+        if inert:
+            template_vars.update(inert)
+        yield {
+            'id': idx + 1,
+            'variables': template_vars,
+            'prompt': prompt
+        }
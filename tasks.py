@@ -0,0 +1,169 @@
+# 后台任务：批量生成、导出等耗时操作在线程池中执行，会话只轮询进度，可随时取消
+# 线程池大小即整个服务同时执行的任务数上限，超出的任务排队等待，单个超大任务不会占满全部资源
+#
+# 环境变量：
+#   SORA2_MAX_TASKS=2               同时执行的后台任务数
+#   SORA2_BACKGROUND_MIN_ROWS=10000 少于该条数的任务直接在当前脚本中执行（轮询的延迟比执行本身还长）
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_TASKS = int(os.environ.get("SORA2_MAX_TASKS", "2"))
+BACKGROUND_MIN_ROWS = int(os.environ.get("SORA2_BACKGROUND_MIN_ROWS", "10000"))
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+STATUS_LABELS = {
+    QUEUED: "排队中",
+    RUNNING: "执行中",
+    DONE: "已完成",
+    CANCELLED: "已取消",
+    FAILED: "失败",
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class TaskCancelled(Exception):
+    """任务被取消，在 track() 消费下一批记录时抛出"""
+
+
+class Task:
+    """一个后台任务的状态和进度
+
+    任务函数接收 Task 本身，用 track() 包装逐条（或逐分片）消费的迭代器，
+    即可自动统计进度并在取消时尽快停止。
+    """
+
+    def __init__(self, label, total, func):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._func = func
+        self._cancel = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def track(self, items, size=None):
+        """逐个产出 items 并累计进度
+
+        Args:
+            size: 每个元素代表的条数，例如分片 lambda shard: len(shard[0])；默认每个元素1条
+        """
+        for item in items:
+            if self._cancel.is_set():
+                raise TaskCancelled()
+            yield item
+            self.done += size(item) if size else 1
+
+    def cancel(self):
+        """请求取消；排队中的任务不再执行，执行中的任务在下一次 track() 时停止"""
+        self._cancel.set()
+
+    def add_done_callback(self, callback):
+        """任务结束后调用 callback(task)；已结束时立即调用（在当前线程）"""
+        with self._callbacks_lock:
+            if not self.finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, CANCELLED, FAILED)
+
+    def run(self):
+        if self._cancel.is_set():
+            self._finish(CANCELLED)
+            return
+        self.status = RUNNING
+        self.started_at = time.monotonic()
+        status = FAILED
+        try:
+            self.result = self._func(self)
+            status = DONE
+        except Exception as e:
+            # 取消后资源被调用方释放（如关闭存储）引起的错误也视为取消
+            if isinstance(e, TaskCancelled) or self._cancel.is_set():
+                status = CANCELLED
+            else:
+                self.error = e
+        finally:
+            self.finished_at = time.monotonic()
+            self._finish(status)
+
+    def _finish(self, status):
+        with self._callbacks_lock:
+            self.status = status
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+    def progress(self):
+        """(已完成条数, 每秒条数, 预计剩余秒数)；尚未开始或无法估计时速度和剩余时间为 None"""
+        if self.started_at is None:
+            return self.done, None, None
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        if elapsed <= 0 or not self.done:
+            return self.done, None, None
+        rate = self.done / elapsed
+        return self.done, rate, max(self.total - self.done, 0) / rate
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_TASKS, thread_name_prefix="sora2-task")
+        return _executor
+
+
+def submit(label, total, func, background=None):
+    """提交任务
+
+    Args:
+        label: 任务说明
+        total: 预计条数，用于进度和剩余时间
+        func: 任务函数 func(task)，返回值保存在 task.result
+        background: 是否放入后台线程池；默认按 total 与 BACKGROUND_MIN_ROWS 比较决定
+
+    Returns:
+        Task；直接执行时返回时已经结束
+    """
+    task = Task(label, total, func)
+    if background is None:
+        background = total >= BACKGROUND_MIN_ROWS
+    if background:
+        _get_executor().submit(task.run)
+    else:
+        task.run()
+    return task
+
+
+def format_progress(task):
+    """进度文字：条数、速度、预计剩余时间"""
+    done, rate, eta = task.progress()
+    text = f"{STATUS_LABELS[task.status]}：{done:,}/{task.total:,} 条"
+    if task.status == RUNNING and rate:
+        text += f" · {rate:,.0f} 条/秒 · 预计剩余 {eta:.0f} 秒"
+    return text
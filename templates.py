@@ -1,5 +1,8 @@
 # Sora2 提示词模板库
 
+import string
+from collections import namedtuple
+
 TEMPLATES = {
     "Nike运动广告": {
         "name": "Nike中国Anytime经典创意营销广告",
@@ -153,3 +156,66 @@ INDUSTRY_TYPES = {
     "文旅宣传": ["城市形象", "景点推广", "文化展示", "旅游攻略"],
     "品牌广告": ["品牌故事", "形象宣传", "产品发布", "企业文化"]
 }
+
+# ========== 界面选项表（导入时构建一次，页面重跑直接复用） ==========
+
+TEMPLATE_OPTIONS = ["自定义"] + list(TEMPLATES.keys())
+INDUSTRY_OPTIONS = ["不限"] + list(INDUSTRY_TYPES.keys())
+CAMERA_SPEED_OPTIONS = ["不限"] + CAMERA_LANGUAGE["镜头速度"]
+WEATHER_OPTIONS = ["不限"] + PHYSICS_EFFECTS["天气氛围"]
+MUSIC_TYPE_OPTIONS = ["不限"] + AUDIO_SUGGESTIONS["音乐类型"]
+RHYTHM_OPTIONS = ["不限"] + AUDIO_SUGGESTIONS["节奏匹配"]
+RHYTHM_PATTERN_OPTIONS = ["不限"] + TIMING_RHYTHM["节奏分段"]
+SHOT_TRANSITION_OPTIONS = ["不限"] + TIMING_RHYTHM["镜头切换"]
+
+# 批量参数扫描可用的控制维度：维度名 -> (settings 键, 可选值, 是否多选控件)
+# 多选控件的每个扫描取值作为唯一选项
+SWEEP_AXES = {
+    "国家/地区": ("country", COUNTRIES, False),
+    "时长": ("duration", DURATIONS, False),
+    "视觉风格": ("visual_style", VISUAL_STYLES, True),
+    "镜头运用": ("camera_technique", CAMERA_TECHNIQUES, True),
+    "色调/氛围": ("tone", TONES, False),
+    "导演风格": ("director_style", DIRECTOR_STYLES, False),
+    "镜头类型": ("camera_type", CAMERA_LANGUAGE["镜头类型"], True),
+    "运镜方式": ("camera_movement", CAMERA_LANGUAGE["运镜方式"], True),
+    "景深效果": ("depth_of_field", CAMERA_LANGUAGE["景深效果"], True),
+    "镜头速度": ("camera_speed", CAMERA_LANGUAGE["镜头速度"], False),
+    "光影效果": ("lighting", PHYSICS_EFFECTS["光影效果"], True),
+    "粒子效果": ("particles", PHYSICS_EFFECTS["粒子效果"], True),
+    "天气氛围": ("weather", PHYSICS_EFFECTS["天气氛围"], False),
+    "物理模拟": ("physics_sim", PHYSICS_EFFECTS["物理模拟"], True),
+    "音乐类型": ("music_type", AUDIO_SUGGESTIONS["音乐类型"], False),
+    "音效建议": ("sound_effects", AUDIO_SUGGESTIONS["音效建议"], True),
+    "节奏匹配": ("rhythm", AUDIO_SUGGESTIONS["节奏匹配"], False),
+    "节奏分段": ("rhythm_pattern", TIMING_RHYTHM["节奏分段"], False),
+    "镜头切换": ("shot_transition", TIMING_RHYTHM["镜头切换"], False),
+}
+
+# ========== 模板预编译 ==========
+
+# literals: 占位符之间的原始文本段（比 fields 多一个）；fields: 按出现顺序的占位符（可重复）；
+# fmt: 占位符替换为 %s 的格式串
+CompiledTemplate = namedtuple("CompiledTemplate", ["literals", "fields", "fmt"])
+
+
+def compile_template(text):
+    """将模板文本预解析为 CompiledTemplate，解析一次、渲染多次"""
+    literals = []
+    fields = []
+    pending = ""
+    for literal, field_name, _spec, _conversion in string.Formatter().parse(text):
+        pending += literal
+        if field_name is not None:
+            literals.append(pending)
+            fields.append(field_name)
+            pending = ""
+    literals.append(pending)
+    fmt = "%s".join(literal.replace("%", "%%") for literal in literals)
+    return CompiledTemplate(tuple(literals), tuple(fields), fmt)
+
+
+COMPILED_TEMPLATES = {
+    name: compile_template(template["template"])
+    for name, template in TEMPLATES.items()
+}
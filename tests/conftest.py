@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ai
+from response_cache import ResponseCache
+from stub_server import StubServer
+
+
+@pytest.fixture(autouse=True)
+def isolated_ai(tmp_path, monkeypatch):
+    """每个测试使用独立的响应缓存，重试不等待"""
+    monkeypatch.setattr(ai, "_response_cache", ResponseCache(str(tmp_path / "responses.sqlite3")))
+    monkeypatch.setattr(ai, "_retry_delay", lambda attempt: 0)
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer().start()
+    yield server
+    server.stop()
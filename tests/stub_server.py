@@ -0,0 +1,148 @@
+# 本地的 OpenAI 兼容服务（只实现 POST /v1/chat/completions，支持 stream），用于测试批量增强、任务队列和单飞
+# 每个请求在独立线程中处理，记录开始/结束时间和同时处理的请求数
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubReply:
+    """handler 的返回值：状态码、文本、错误码（如 insufficient_quota）和处理前的延迟秒数"""
+
+    def __init__(self, text="", status=200, delay=0.0, code=None):
+        self.text = text
+        self.status = status
+        self.delay = delay
+        self.code = code
+
+
+def echo_handler(request):
+    """默认响应：在用户内容前加上 enhanced: 前缀"""
+    return StubReply(f"enhanced:{request['content']}")
+
+
+STREAM_CHUNK = 4
+
+
+class StubServer:
+    """OpenAI 兼容的桩服务
+
+    handler(request) 返回 StubReply；request 包含 system、content、stream 和 attempt（同一内容第几次到达，1 起）。
+    流式请求把回复文本按 STREAM_CHUNK 个字符切分，逐段以 SSE 返回。
+
+    Attributes:
+        requests: 已处理的请求 [{'system', 'content', 'stream', 'attempt', 'status', 'started', 'finished'}]
+        max_active: 同时处理的请求数峰值
+    """
+
+    def __init__(self, handler=echo_handler):
+        self.handler = handler
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_request_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def contents(self, status=None):
+        """按到达顺序的用户内容；status 指定时只返回该状态码的请求"""
+        with self._lock:
+            return [r['content'] for r in self.requests if status is None or r['status'] == status]
+
+    def _handle(self, body):
+        messages = body.get("messages", [])
+        system = next((m['content'] for m in messages if m['role'] == "system"), "")
+        content = next((m['content'] for m in messages if m['role'] == "user"), "")
+        stream = bool(body.get("stream"))
+        started = time.monotonic()
+        with self._lock:
+            attempt = self._attempts[content] = self._attempts.get(content, 0) + 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            reply = self.handler({'system': system, 'content': content, 'stream': stream, 'attempt': attempt})
+            if reply.delay:
+                time.sleep(reply.delay)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.requests.append({
+                    'system': system, 'content': content, 'stream': stream, 'attempt': attempt,
+                    'status': reply.status, 'started': started, 'finished': time.monotonic(),
+                })
+        if reply.status != 200:
+            return reply.status, {"error": {"message": reply.text or f"stub error {reply.status}", "type": "stub_error", "code": reply.code}}
+        if stream:
+            return 200, [
+                {"choices": [{"index": 0, "delta": {"content": reply.text[i:i + STREAM_CHUNK]}, "finish_reason": None}]}
+                for i in range(0, len(reply.text), STREAM_CHUNK)
+            ] + [{"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}]
+        return 200, {
+            "id": f"chatcmpl-stub-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply.text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(system + content), "completion_tokens": len(reply.text), "total_tokens": len(system + content + reply.text)},
+        }
+
+    def _make_request_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    status, payload = server._handle(body)
+                else:
+                    status, payload = 404, {"error": {"message": "not found", "type": "stub_error", "code": None}}
+                if isinstance(payload, list):
+                    self._send_stream(payload, body.get("model", "stub"))
+                    return
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, chunks, model):
+                # 不带 Content-Length，发送完毕后关闭连接
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        event = {"id": "chatcmpl-stub-stream", "object": "chat.completion.chunk", "created": int(time.time()), "model": model, **chunk}
+                        self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前关闭了流
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
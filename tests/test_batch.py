@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fixtures import FULL_CUSTOM_SETTINGS, SETTINGS
+from batch import iter_batch, split_variables
+from templates import DIRECTOR_STYLES, TONES
+
+
+def distinct_prompts(settings, variables):
+    active, inert = split_variables(settings, variables)
+    rows = list(iter_batch(settings, active, inert=inert))
+    return len(rows), len({row['prompt'] for row in rows})
+
+
+def test_unused_variables_are_inert():
+    settings = {**SETTINGS, 'selected_template': "环保宏伟广告"}
+    active, inert = split_variables(settings, {"品牌": ["A", "B"], "备注": ["x", "y"], "导演风格": DIRECTOR_STYLES[:3]})
+    assert list(active) == ["导演风格"]
+    assert inert == {"品牌": ["A", "B"], "备注": ["x", "y"]}
+
+
+def test_value_dependent_inertness():
+    # 「色调氛围」在选了视觉风格时不使用 tone
+    settings = {**SETTINGS, 'selected_template': "环保宏伟广告", 'visual_style': ["电影感"]}
+    assert distinct_prompts(settings, {"色调/氛围": TONES[:3]}) == (1, 1)
+    assert distinct_prompts(settings, {"色调/氛围": TONES[:3], "导演风格": DIRECTOR_STYLES[:3]}) == (3, 3)
+    active, _ = split_variables({**settings, 'visual_style': []}, {"色调/氛围": TONES[:3]})
+    assert list(active) == ["色调/氛围"]
+
+
+def test_duplicate_values_are_removed():
+    active, _ = split_variables(FULL_CUSTOM_SETTINGS, {"品牌": ["A", "B", "A"]})
+    assert active == {"品牌": ["A", "B"]}
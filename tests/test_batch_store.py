@@ -0,0 +1,107 @@
+import itertools
+import os
+import time
+
+import pytest
+
+from batch import CombinationIds
+from batch_store import BatchStore, StoreClosedError, sweep_stale_stores
+
+
+def make_rows(count, needles=()):
+    for i in range(1, count + 1):
+        yield {'id': i, 'variables': {'城市': "长沙" if i % 2 else "成都"}, 'prompt': f"needle {i}" if i in needles else f"row {i}"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BatchStore.create(str(tmp_path))
+    yield store
+    store.close()
+
+
+def search_all(view, text, limit, scan_rows):
+    """按续查位置反复搜索直到找够 limit 条或扫描到末尾，返回 (匹配, 调用次数)"""
+    matches, cursor, calls = [], 0, 0
+    while cursor is not None and len(matches) < limit:
+        found, cursor = view.search(text, after_id=cursor, limit=limit - len(matches), scan_rows=scan_rows)
+        matches.extend(found)
+        calls += 1
+    return matches, calls
+
+
+def test_search_stops_at_scan_budget(store):
+    store.write(make_rows(1000, needles={700}))
+    view = store.view()
+    assert view.search("needle", limit=10, scan_rows=100) == ([], 100)
+    assert view.search("needle", after_id=600, limit=10, scan_rows=100) == ([700], 700)
+    assert view.search("needle", after_id=700, limit=10, scan_rows=1000) == ([], None)
+    # 按 id 范围每次扫描 100 个，10 次扫完全部记录
+    assert search_all(view, "needle", 10, 100) == ([700], 10)
+
+
+def test_search_returns_cursor_after_limit(store):
+    store.write(make_rows(100, needles={10, 20, 30}))
+    view = store.view()
+    assert view.search("needle", limit=2) == ([10, 20], 20)
+    assert view.search("needle", after_id=20, limit=2) == ([30], None)
+
+
+def test_search_with_filter(store):
+    store.write(make_rows(100, needles={10, 11, 12, 13}))
+    view = store.view({'城市': "长沙"})
+    # 扫描预算按 id 范围计，不按筛选后的条数
+    assert view.search("needle", limit=10, scan_rows=7) == ([], 7)
+    assert search_all(view, "needle", 10, 7) == ([11, 13], 15)
+    assert len(view) == 50
+
+
+def test_view_by_combination_ids(store):
+    variables = {'城市': ["长沙", "成都", "重庆"], '季节': ["春", "夏"]}
+    combinations = itertools.product(variables['城市'], variables['季节'])
+    store.write({'id': i, 'variables': {'城市': city, '季节': season}, 'prompt': city + season} for i, (city, season) in enumerate(combinations, 1))
+    view = store.view({'季节': "夏"}, ids=CombinationIds(variables, {'季节': "夏"}))
+    assert len(view) == 3
+    assert [p['prompt'] for p in view.rows(1, 10)] == ["成都夏", "重庆夏"]
+    assert view.search("夏", limit=2) == ([2, 4], 4)
+    assert view.search("夏", after_id=4, limit=2) == ([6], None)
+    assert view.search("重", limit=10, scan_rows=2) == ([], 2)
+    assert view.search("重", after_id=2, limit=10, scan_rows=4) == ([6], None)
+    assert 5 not in CombinationIds(variables, {"季节": "夏"})
+    assert len(store.view({'季节': "冬"}, ids=CombinationIds(variables, {'季节': "冬"}))) == 0
+
+
+def age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_sweep_keeps_open_stores(tmp_path):
+    store = BatchStore.create(str(tmp_path))
+    store.write(make_rows(10))
+    orphan = tmp_path / "batch_orphan.sqlite3"
+    orphan.write_bytes(b"")
+    orphan_wal = tmp_path / "batch_orphan.sqlite3-wal"
+    orphan_wal.write_bytes(b"")
+    for path in tmp_path.iterdir():
+        age(path, 3600)
+
+    sweep_stale_stores(str(tmp_path), max_age=60)
+    assert os.path.exists(store.path)
+    assert not orphan.exists() and not orphan_wal.exists()
+    assert len(store.view().rows(0, 10)) == 10
+
+    store.close()
+    assert not os.path.exists(store.path)
+    with pytest.raises(StoreClosedError):
+        store.view().rows(0, 10)
+
+
+def test_open_store_refreshes_mtime(tmp_path, monkeypatch):
+    import batch_store
+    monkeypatch.setattr(batch_store, "TOUCH_SECONDS", 0)
+    store = BatchStore.create(str(tmp_path))
+    age(store.path, 3600)
+    store.view().rows(0, 1)
+    assert time.time() - os.path.getmtime(store.path) < 60
+    store.close()
@@ -0,0 +1,224 @@
+import json
+import time
+
+import openai
+import pytest
+
+import ai
+from stub_server import StubReply
+
+
+def make_items(count):
+    return [(i, f"prompt-{i:03d}") for i in range(count)]
+
+
+def item_index(request):
+    """从请求内容中取出条目序号"""
+    return int(request['content'].split("prompt-")[1][:3])
+
+
+class EmptyLimiter(ai.RateLimiter):
+    """额度从0开始的限流器，不必先用完一分钟的突发额度就能观察到限速"""
+
+    def __init__(self, rpm=None, tpm=None):
+        super().__init__(rpm, tpm)
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.available = 0
+
+
+def run_batch(server, items, **kwargs):
+    calls = []
+    results = ai.enhance_batch(
+        "sk-test", items, base_url=server.base_url,
+        on_result=lambda item_id, text, error: calls.append((item_id, text, error, time.monotonic())),
+        **kwargs
+    )
+    return results, calls
+
+
+def test_results_for_every_item(stub_server):
+    items = make_items(10)
+    results, calls = run_batch(stub_server, items)
+    assert sorted(results) == [item_id for item_id, _ in items]
+    for item_id, prompt in items:
+        assert results[item_id] == f"enhanced:{ai.ENHANCE_USER_TEMPLATE.format(prompt=prompt)}"
+    assert sorted(call[0] for call in calls) == sorted(results)
+    assert all(call[2] is None for call in calls)
+
+
+def test_concurrency_is_bounded(stub_server):
+    stub_server.handler = lambda request: StubReply(f"ok {request['content']}", delay=0.1)
+    results, _ = run_batch(stub_server, make_items(12), concurrency=3)
+    assert len(results) == 12
+    assert stub_server.max_active == 3
+
+
+def test_rpm_limit_spaces_requests(stub_server, monkeypatch):
+    monkeypatch.setattr(ai, "RateLimiter", EmptyLimiter)
+    # 600 RPM = 每 0.1 秒一个请求
+    run_batch(stub_server, make_items(8), concurrency=8, rpm=600)
+    started = sorted(request['started'] for request in stub_server.requests)
+    assert started[-1] - started[0] >= 7 * 0.1 * 0.8
+
+
+def test_tpm_limit_spaces_requests(stub_server, monkeypatch):
+    monkeypatch.setattr(ai, "RateLimiter", EmptyLimiter)
+    items = make_items(6)
+    # 每条的 token 估算相同，TPM 设为每 0.1 秒一条的额度
+    cost = ai.estimate_tokens(ai.ENHANCE_SYSTEM_PROMPT + ai.ENHANCE_USER_TEMPLATE.format(prompt=items[0][1])) + ai.ENHANCE_COMPLETION_TOKENS
+    run_batch(stub_server, items, concurrency=6, tpm=cost * 600)
+    started = sorted(request['started'] for request in stub_server.requests)
+    assert started[-1] - started[0] >= 5 * 0.1 * 0.8
+
+
+def test_retries_rate_limit_and_server_errors(stub_server):
+    failures = {0: [429], 1: [500], 2: [503, 502]}
+
+    def handler(request):
+        statuses = failures.get(item_index(request), [])
+        if request['attempt'] <= len(statuses):
+            return StubReply(status=statuses[request['attempt'] - 1])
+        return StubReply(f"ok {item_index(request)}")
+
+    stub_server.handler = handler
+    results, calls = run_batch(stub_server, make_items(4), max_retries=3)
+    assert results == {i: f"ok {i}" for i in range(4)}
+    assert all(call[2] is None for call in calls)
+    attempts = {}
+    for request in stub_server.requests:
+        attempts[item_index(request)] = attempts.get(item_index(request), 0) + 1
+    assert attempts == {0: 2, 1: 2, 2: 3, 3: 1}
+
+
+def test_exhausted_retries_and_client_errors_are_reported(stub_server):
+    def handler(request):
+        index = item_index(request)
+        if index == 0:
+            return StubReply(status=500)
+        if index == 1:
+            return StubReply(status=400)
+        return StubReply("ok")
+
+    stub_server.handler = handler
+    results, calls = run_batch(stub_server, make_items(3), max_retries=2)
+    assert results == {2: "ok"}
+    errors = {call[0]: call[2] for call in calls}
+    assert isinstance(errors[0], openai.InternalServerError)
+    assert isinstance(errors[1], openai.BadRequestError)
+    # 5xx 重试 max_retries 次后放弃，400 不重试
+    assert len([r for r in stub_server.requests if item_index(r) == 0]) == 3
+    assert len([r for r in stub_server.requests if item_index(r) == 1]) == 1
+
+
+def test_on_result_streams_in_completion_order(stub_server):
+    # 越靠前的条目越慢：完成顺序与提交顺序相反
+    stub_server.handler = lambda request: StubReply(f"ok {item_index(request)}", delay=(5 - item_index(request)) * 0.1)
+    _, calls = run_batch(stub_server, make_items(5), concurrency=5)
+    assert [call[0] for call in calls] == [4, 3, 2, 1, 0]
+    # 第一条结果在最慢的请求完成前就已回调
+    slowest = max(request['finished'] for request in stub_server.requests)
+    assert calls[0][3] < slowest - 0.2
+
+
+def test_on_result_follows_input_order_without_concurrency(stub_server):
+    stub_server.handler = lambda request: StubReply(f"ok {item_index(request)}", delay=(5 - item_index(request)) * 0.02)
+    _, calls = run_batch(stub_server, make_items(5), concurrency=1)
+    assert [call[0] for call in calls] == [0, 1, 2, 3, 4]
+
+
+def test_cached_results_skip_the_server(stub_server):
+    items = make_items(4)
+    first, _ = run_batch(stub_server, items)
+    second, calls = run_batch(stub_server, items)
+    assert second == first
+    assert len(stub_server.requests) == 4
+    assert len(calls) == 4
+
+
+def test_packed_requests_fall_back_per_item_on_bad_json(stub_server):
+    def handler(request):
+        if request['system'] == ai.PACKED_ENHANCE_SYSTEM_PROMPT:
+            return StubReply("not json")
+        return StubReply(f"ok {item_index(request)}")
+
+    stub_server.handler = handler
+    results, _ = run_batch(stub_server, make_items(6), pack_size=3)
+    assert results == {i: f"ok {i}" for i in range(6)}
+    assert len(stub_server.contents()) == 2 + 6
+
+
+def packed_handler(status, code=None):
+    """打包请求返回 status，逐条请求正常返回"""
+    def handler(request):
+        if request['system'] == ai.PACKED_ENHANCE_SYSTEM_PROMPT:
+            return StubReply(status=status, code=code)
+        return StubReply(f"ok {item_index(request)}")
+    return handler
+
+
+@pytest.mark.parametrize("status, code, error", [
+    (401, None, openai.AuthenticationError),
+    (403, None, openai.PermissionDeniedError),
+    (400, None, openai.BadRequestError),
+    (429, "insufficient_quota", openai.RateLimitError),
+])
+def test_packed_fatal_errors_stop_the_batch(stub_server, status, code, error):
+    stub_server.handler = packed_handler(status, code)
+    with pytest.raises(error):
+        run_batch(stub_server, make_items(3), pack_size=3, max_retries=3)
+    # 不重试、不拆成逐条请求
+    assert len(stub_server.requests) == 1
+
+
+def test_packed_server_errors_fail_the_pack_without_fallback(stub_server):
+    stub_server.handler = packed_handler(500)
+    results, calls = run_batch(stub_server, make_items(3), pack_size=3, max_retries=1)
+    assert results == {}
+    assert all(isinstance(call[2], openai.InternalServerError) for call in calls)
+    assert len(calls) == 3
+    assert all(r['system'] == ai.PACKED_ENHANCE_SYSTEM_PROMPT for r in stub_server.requests)
+    assert len(stub_server.requests) == 2
+
+
+def test_packed_request_is_limited_by_input_plus_estimated_output(stub_server, monkeypatch):
+    acquired = []
+
+    class RecordingLimiter(ai.RateLimiter):
+        async def acquire(self, tokens):
+            acquired.append(tokens)
+            await super().acquire(tokens)
+
+    monkeypatch.setattr(ai, "RateLimiter", RecordingLimiter)
+    stub_server.handler = lambda request: StubReply('{"results": [{"id": 0, "prompt": "a"}, {"id": 1, "prompt": "b"}]}')
+    run_batch(stub_server, make_items(2), pack_size=2)
+    content = stub_server.requests[0]['content']
+    expected = ai.estimate_tokens(ai.PACKED_ENHANCE_SYSTEM_PROMPT + content) + 2 * ai.ENHANCE_COMPLETION_TOKENS
+    assert acquired == [expected]
+
+
+def test_fallback_requests_share_the_concurrency_limit(stub_server):
+    def handler(request):
+        if request['system'] == ai.PACKED_ENHANCE_SYSTEM_PROMPT:
+            return StubReply("not json")
+        return StubReply(f"ok {item_index(request)}", delay=0.05)
+
+    stub_server.handler = handler
+    results, _ = run_batch(stub_server, make_items(12), pack_size=4, concurrency=2)
+    assert len(results) == 12
+    # 每个逐条回退请求各占一个名额，而不是每包一个
+    assert stub_server.max_active == 2
+
+
+def test_packed_and_single_results_share_the_cache(stub_server):
+    items = make_items(4)
+    stub_server.handler = lambda request: StubReply(
+        json.dumps({"results": [{"id": i, "prompt": f"packed {i}"} for i in range(2)]})
+        if request['system'] == ai.PACKED_ENHANCE_SYSTEM_PROMPT else f"single {item_index(request)}"
+    )
+    packed, _ = run_batch(stub_server, items[:2], pack_size=2)
+    single, _ = run_batch(stub_server, items, pack_size=1)
+    assert single == {**packed, 2: "single 2", 3: "single 3"}
+    repacked, _ = run_batch(stub_server, items, pack_size=4)
+    assert repacked == single
+    assert len(stub_server.requests) == 3
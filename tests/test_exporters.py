@@ -0,0 +1,28 @@
+import os
+import time
+
+import exporters
+
+
+def rows(count):
+    return ({'id': i, 'variables': {'n': i}, 'prompt': f"prompt {i}"} for i in range(1, count + 1))
+
+
+def test_stale_exports_are_swept(tmp_path, monkeypatch):
+    monkeypatch.setattr(exporters, "EXPORT_DIR", str(tmp_path))
+    leaked, _, _ = exporters.export_prompts(rows(3), "JSONL")
+    kept, _, _ = exporters.export_prompts(rows(3), "CSV")
+    other = tmp_path / "unrelated.txt"
+    other.write_text("x")
+    old = time.time() - exporters.EXPORT_STALE_SECONDS - 60
+    for path in (leaked, kept, other):
+        os.utime(path, (old, old))
+
+    # 仍在使用的导出更新修改时间后不会被清理
+    assert exporters.touch_export(kept)
+    exporters.sweep_stale_exports(str(tmp_path))
+    assert not os.path.exists(leaked)
+    assert os.path.exists(kept) and other.exists()
+
+    exporters.remove_export(kept)
+    assert not exporters.touch_export(kept)
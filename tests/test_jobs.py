@@ -0,0 +1,177 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from stub_server import StubReply
+
+
+def make_items(count):
+    """批量结果的 id 从 1 开始"""
+    return [(i, {'n': i}, f"prompt-{i:03d}") for i in range(1, count + 1)]
+
+
+def item_index(request):
+    return int(request['content'].split("prompt-")[1][:3])
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = jobs.JobQueue(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_queue", queue)
+    monkeypatch.setattr(jobs, "_runners", {})
+    return queue
+
+
+def run_job(job_id, on_result=None):
+    assert jobs.start_job(job_id, "sk-test", on_result=on_result)
+    jobs._runners[job_id].join(timeout=30)
+    assert not jobs._runners[job_id].is_alive()
+
+
+def test_results_are_checkpointed_while_running(queue, stub_server):
+    release = threading.Event()
+
+    def handler(request):
+        if item_index(request) == 5:
+            release.wait(timeout=10)
+        return StubReply(f"ok {item_index(request)}")
+
+    stub_server.handler = handler
+    job_id = queue.create(make_items(5), {'base_url': stub_server.base_url, 'concurrency': 5})
+    synced = []
+    assert jobs.start_job(job_id, "sk-test", on_result=lambda item_id, text: synced.append(item_id))
+    # 已完成的 4 条在任务结束前就已写入任务库
+    deadline = time.monotonic() + 10
+    while queue.progress(job_id)['done'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    progress = queue.progress(job_id)
+    assert progress['status'] == jobs.RUNNING
+    assert (progress['done'], progress['pending']) == (4, 1)
+    assert [r['id'] for r in queue.results(job_id)] == [1, 2, 3, 4]
+    # 执行中的任务不会重复启动
+    assert not jobs.start_job(job_id, "sk-test")
+
+    release.set()
+    jobs._runners[job_id].join(timeout=10)
+    assert queue.progress(job_id)['status'] == jobs.DONE
+    assert sorted(synced) == [1, 2, 3, 4, 5]
+    assert queue.results(job_id, after_id=3) == [
+        {'id': 4, 'variables': {'n': 4}, 'prompt': "ok 4"},
+        {'id': 5, 'variables': {'n': 5}, 'prompt': "ok 5"},
+    ]
+
+
+def test_partial_failure_and_resume(queue, stub_server):
+    fail = {2}
+    stub_server.handler = lambda request: StubReply(status=400) if item_index(request) in fail else StubReply(f"ok {item_index(request)}")
+    job_id = queue.create(make_items(4), {'base_url': stub_server.base_url})
+    run_job(job_id)
+
+    progress = queue.progress(job_id)
+    assert progress['status'] == jobs.PARTIAL
+    assert (progress['done'], progress['failed'], progress['pending']) == (3, 1, 0)
+    assert [r['id'] for r in queue.results(job_id)] == [1, 3, 4]
+    assert queue.unfinished_items(job_id) == [(2, "prompt-002")]
+
+    # 继续执行只重新发送失败的条目
+    fail.clear()
+    sent = len(stub_server.requests)
+    run_job(job_id)
+    assert queue.progress(job_id)['status'] == jobs.DONE
+    assert [item_index(r) for r in stub_server.requests[sent:]] == [2]
+    assert [r['prompt'] for r in queue.results(job_id)] == ["ok 1", "ok 2", "ok 3", "ok 4"]
+
+
+def test_items_added_later_are_picked_up(queue, stub_server):
+    job_id = queue.create(make_items(2), {'base_url': stub_server.base_url})
+    run_job(job_id)
+    queue.add_items(job_id, make_items(4))
+    run_job(job_id)
+    assert queue.progress(job_id)['done'] == 4
+    # 已完成的条目没有再次请求
+    assert sorted(item_index(r) for r in stub_server.requests) == [1, 2, 3, 4]
+
+
+def test_running_job_is_interrupted_on_restart(queue, stub_server, monkeypatch):
+    job_id = queue.create(make_items(3), {'base_url': stub_server.base_url})
+    queue.record(job_id, 1, "ok 1")
+    # 模拟执行中服务退出：状态仍为执行中
+    queue.set_status(job_id, jobs.RUNNING)
+
+    restarted = jobs.JobQueue(queue.path)
+    assert restarted.progress(job_id)['status'] == jobs.INTERRUPTED
+    assert restarted.unfinished_items(job_id) == [(2, "prompt-002"), (3, "prompt-003")]
+
+    monkeypatch.setattr(jobs, "_queue", restarted)
+    run_job(job_id)
+    assert restarted.progress(job_id)['status'] == jobs.DONE
+    assert sorted(item_index(r) for r in stub_server.requests) == [2, 3]
+
+
+def test_batch_error_interrupts_job(queue, monkeypatch):
+    def failing_batch(api_key, items, on_result=None, **params):
+        on_result(items[0][0], "ok", None)
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(jobs, "enhance_batch", failing_batch)
+    job_id = queue.create(make_items(3), {})
+    run_job(job_id)
+    progress = queue.progress(job_id)
+    assert progress['status'] == jobs.INTERRUPTED
+    assert progress['error'] == "RuntimeError: connection lost"
+    assert progress['done'] == 1
+
+
+def test_record_does_not_overwrite_done_items(queue):
+    job_id = queue.create(make_items(1), {})
+    queue.record(job_id, 1, "first")
+    queue.record(job_id, 1, "second")
+    queue.record(job_id, 1, error=ValueError("late failure"))
+    assert queue.results(job_id)[0]['prompt'] == "first"
+    assert queue.progress(job_id)['failed'] == 0
+
+
+def test_results_paging(queue):
+    job_id = queue.create(make_items(5), {})
+    for item_id in (1, 2, 4, 5):
+        queue.record(job_id, item_id, f"ok {item_id}")
+    assert [r['id'] for r in queue.results(job_id, offset=1, limit=2)] == [2, 4]
+    assert [r['id'] for r in queue.results(job_id, offset=3)] == [5]
+    assert [r['id'] for r in queue.results(job_id, after_id=2, limit=1)] == [4]
+
+
+def test_items_added_while_finishing_are_not_lost(queue, monkeypatch):
+    calls = []
+
+    def fake_batch(api_key, items, on_result=None, **params):
+        calls.append([item_id for item_id, _ in items])
+        for item_id, _ in items:
+            on_result(item_id, f"ok {item_id}", None)
+        if len(calls) == 1:
+            # 执行线程仍在执行中：追加的条目由它继续处理，不重复启动
+            queue.add_items(job_id, make_items(3))
+            assert not jobs.start_job(job_id, "sk-test")
+
+    monkeypatch.setattr(jobs, "enhance_batch", fake_batch)
+    job_id = queue.create(make_items(2), {})
+    run_job(job_id)
+    assert calls == [[1, 2], [3]]
+    progress = queue.progress(job_id)
+    assert (progress['status'], progress['done'], progress['pending']) == (jobs.DONE, 3, 0)
+
+
+def test_finished_runner_does_not_block_restart(queue, stub_server, monkeypatch):
+    job_id = queue.create(make_items(2), {'base_url': stub_server.base_url})
+    # 已写入最终状态、尚未退出的执行线程
+    exiting = threading.Event()
+    runner = threading.Thread(target=exiting.wait, daemon=True)
+    runner.start()
+    monkeypatch.setitem(jobs._runners, job_id, runner)
+    queue.set_status(job_id, jobs.DONE)
+    try:
+        run_job(job_id)
+    finally:
+        exiting.set()
+    assert queue.progress(job_id)['done'] == 2
@@ -0,0 +1,28 @@
+import os
+import threading
+
+import metrics
+
+
+def test_concurrent_flushes(tmp_path, monkeypatch):
+    directory = tmp_path / "metrics"
+    path = str(directory / "sora2.prom")
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "METRICS_FILE", path)
+    errors = []
+
+    def flush_many():
+        for _ in range(200):
+            try:
+                metrics.flush()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=flush_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    # 没有遗留的临时文件
+    assert os.listdir(directory) == ["sora2.prom"]
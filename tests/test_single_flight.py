@@ -0,0 +1,160 @@
+import threading
+import time
+
+import openai
+import pytest
+
+import ai
+import metrics
+from stub_server import StubReply, StubServer
+
+SYSTEM = ai.OPTIMIZE_SYSTEM_PROMPT
+CONTENT = "同一个需求"
+
+
+@pytest.fixture
+def chat_server(stub_server, monkeypatch):
+    """chat_completion / stream_chat_completion 使用的同步客户端指向桩服务"""
+    monkeypatch.setenv("OPENAI_BASE_URL", stub_server.base_url)
+    monkeypatch.setattr(ai, "_clients", {})
+    return stub_server
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    """启用指标并清空计数，返回按指标名和标签读取计数的函数"""
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "_values", {})
+    return lambda name, **labels: metrics._values.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+def run_threads(targets):
+    """每个目标在独立线程中执行，返回 [(结果, 异常)]"""
+    outcomes = [None] * len(targets)
+
+    def run(index, target):
+        try:
+            outcomes[index] = (target(), None)
+        except Exception as e:
+            outcomes[index] = (None, e)
+
+    threads = [threading.Thread(target=run, args=(i, target)) for i, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def join_all(threads):
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+
+
+def blocking_handler(replies):
+    """第 n 个到达的请求等到 release 后返回 replies[n]；entered 在每个请求到达时计数"""
+    state = {'entered': 0, 'release': threading.Event()}
+    lock = threading.Lock()
+
+    def handler(request):
+        with lock:
+            index = state['entered']
+            state['entered'] += 1
+        state['release'].wait(timeout=10)
+        return replies[min(index, len(replies) - 1)]
+
+    return handler, state
+
+
+def test_concurrent_calls_share_one_request(chat_server, counters):
+    handler, state = blocking_handler([StubReply("shared")])
+    chat_server.handler = handler
+    leader, outcomes = run_threads([lambda: ai.chat_completion("sk-test", SYSTEM, CONTENT)])
+    wait_until(lambda: state['entered'] == 1)
+    waiters, waiter_outcomes = run_threads([lambda: ai.chat_completion("sk-test", SYSTEM, CONTENT)] * 4)
+    wait_until(lambda: counters("sora2_openai_coalesced_total", call="optimize") == 4)
+    state['release'].set()
+    join_all(leader + waiters)
+
+    assert outcomes + waiter_outcomes == [("shared", None)] * 5
+    assert len(chat_server.requests) == 1
+    assert counters("sora2_openai_requests_total", call="optimize") == 1
+
+
+def test_waiters_retry_when_the_leader_fails(chat_server, counters):
+    handler, state = blocking_handler([StubReply(status=400), StubReply("retried", delay=0.3)])
+    chat_server.handler = handler
+    leader, outcomes = run_threads([lambda: ai.chat_completion("sk-test", SYSTEM, CONTENT)])
+    wait_until(lambda: state['entered'] == 1)
+    waiters, waiter_outcomes = run_threads([lambda: ai.chat_completion("sk-test", SYSTEM, CONTENT)] * 3)
+    wait_until(lambda: counters("sora2_openai_coalesced_total", call="optimize") == 3)
+    state['release'].set()
+    join_all(leader + waiters)
+
+    # 发起者的错误不传给等待者：等待者中的一个重新发起请求，其余合并到它
+    assert isinstance(outcomes[0][1], openai.BadRequestError)
+    assert waiter_outcomes == [("retried", None)] * 3
+    assert [r['status'] for r in chat_server.requests] == [400, 200]
+
+
+def test_waiters_retry_when_the_stream_is_closed_early(chat_server, counters):
+    chat_server.handler = lambda request: StubReply("streamed in several parts")
+    stream = ai.stream_chat_completion("sk-test", SYSTEM, CONTENT)
+    assert next(stream) == "stre"
+    waiters, outcomes = run_threads([lambda: ai.chat_completion("sk-test", SYSTEM, CONTENT)])
+    wait_until(lambda: counters("sora2_openai_coalesced_total", call="optimize") == 1)
+    # 页面重跑时生成器被关闭，发起者放弃
+    stream.close()
+    join_all(waiters)
+
+    assert outcomes == [("streamed in several parts", None)]
+    assert [r['stream'] for r in chat_server.requests] == [True, False]
+    # 放弃的流没有写入缓存，缓存中是等待者自己请求的完整结果
+    assert "".join(ai.stream_chat_completion("sk-test", SYSTEM, CONTENT)) == "streamed in several parts"
+    assert len(chat_server.requests) == 2
+
+
+def test_different_api_keys_do_not_coalesce(chat_server, counters):
+    handler, state = blocking_handler([StubReply("ok")])
+    chat_server.handler = handler
+    threads, outcomes = run_threads([
+        lambda: ai.chat_completion("sk-a", SYSTEM, CONTENT),
+        lambda: ai.chat_completion("sk-b", SYSTEM, CONTENT),
+    ])
+    wait_until(lambda: state['entered'] == 2)
+    state['release'].set()
+    join_all(threads)
+
+    assert outcomes == [("ok", None)] * 2
+    assert counters("sora2_openai_coalesced_total", call="optimize") == 0
+
+
+def test_different_base_urls_do_not_coalesce(stub_server, counters):
+    other = StubServer().start()
+    try:
+        entered = threading.Barrier(2, timeout=10)
+
+        def handler(request):
+            # 两个服务各自收到请求后才返回
+            entered.wait()
+            return StubReply("ok")
+
+        stub_server.handler = other.handler = handler
+        items = [(1, "prompt-001")]
+        threads, outcomes = run_threads([
+            lambda: ai.enhance_batch("sk-test", items, base_url=stub_server.base_url),
+            lambda: ai.enhance_batch("sk-test", items, base_url=other.base_url),
+        ])
+        join_all(threads)
+    finally:
+        other.stop()
+
+    assert outcomes == [({1: "ok"}, None)] * 2
+    assert len(stub_server.requests) == len(other.requests) == 1
+    assert counters("sora2_openai_coalesced_total", call="enhance") == 0